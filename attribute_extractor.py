@@ -0,0 +1,116 @@
+"""
+Извлечение размера и цвета из названий товаров и модификаций МойСклад
+Шаблоны собираются один раз из справочника colors_sizes_reference
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+from colors_sizes_reference import (
+    ALL_COLORS, ALL_SIZES, VALID_COLORS, VALID_SIZES,
+    color_synonym_key, normalize_size
+)
+
+
+def _alternation(words: Iterable[str]) -> str:
+    """Альтернатива для регулярного выражения (длинные варианты первыми)"""
+    escaped = (re.escape(word).replace('\\ ', r'\s*') for word in sorted(set(words), key=len, reverse=True))
+    return '|'.join(escaped)
+
+
+_RUSSIAN_COLORS = _alternation(ALL_COLORS['russian'])
+_ENGLISH_COLORS = _alternation(ALL_COLORS['english'] + ALL_COLORS['additional'])
+_LETTER_SIZES = _alternation(ALL_SIZES['letter'])
+_UNIVERSAL_SIZES = _alternation(ALL_SIZES['universal'])
+
+# Шаблоны размеров в порядке приоритета: берется первый, чье первое совпадение проходит проверку
+_NUMERIC_SIZE_PATTERNS = [
+    re.compile(r'\((\d{2,3})\)'),  # (42), (44), (46)
+    re.compile(r',\s*(\d{2,3})\s*\)'),  # , 42), , 44)
+    re.compile(r'размер\s*(\d{2,3})', re.IGNORECASE),  # размер 42
+    re.compile(r'(\d{2,3})\s*размер', re.IGNORECASE),  # 42 размер
+    re.compile(r'\b(\d{2,3})\b'),  # просто число 42, 44, 46
+]
+_WORD_SIZE_PATTERNS = [
+    re.compile(rf'\b({_LETTER_SIZES})\b', re.IGNORECASE),  # буквенные размеры
+    re.compile(rf'\b({_UNIVERSAL_SIZES})\b', re.IGNORECASE),  # One Size
+]
+_ALL_SIZE_PATTERNS = _NUMERIC_SIZE_PATTERNS + _WORD_SIZE_PATTERNS
+
+# Шаблоны цветов в порядке приоритета
+_COLOR_PATTERNS = [
+    re.compile(rf'\(([^)]*?(?:{_RUSSIAN_COLORS})[^)]*?)\)', re.IGNORECASE),  # русский цвет в скобках
+    re.compile(rf',\s*([^)]*?(?:{_RUSSIAN_COLORS})[^)]*?)\s*\)', re.IGNORECASE),  # после запятой
+    re.compile(rf'\b({_RUSSIAN_COLORS})\b', re.IGNORECASE),  # отдельным словом
+    re.compile(rf'\b({_ENGLISH_COLORS})\b', re.IGNORECASE),  # английский цвет
+]
+
+# Быстрые проверки: без чисел и без слов из названий цветов соответствующие шаблоны не нужны
+_HAS_NUMBER = re.compile(r'\d{2}')
+_WORDS = re.compile(r'\w+')
+_COLOR_WORDS = frozenset(part for color in VALID_COLORS for part in _WORDS.findall(color))
+
+# Скобки с размером или цветом и разделители, которые убираются из названия
+_CLEAN_PARENS = re.compile(
+    rf'\(\s*(?:\d{{2,3}}|{_LETTER_SIZES}|{_UNIVERSAL_SIZES})\s*\)'
+    rf'|\(\s*[^)]*?(?:{_RUSSIAN_COLORS}|{_ENGLISH_COLORS})[^)]*?\s*\)',
+    re.IGNORECASE
+)
+_CLEAN_SEPARATORS = re.compile(r'[\s,]+')
+
+
+class AttributeExtractor:
+    """Размер, цвет и очищенное название по строке названия
+
+    Результаты запоминаются по названию (lru_cache на cache_size строк):
+    названия модификаций повторяются при каждой пересборке каталога.
+    Возвращаемые словари общие для всех вызовов, изменять их нельзя.
+    """
+
+    def __init__(self, cache_size: int = 50000):
+        self.extract = lru_cache(maxsize=cache_size)(self._extract)
+
+    @staticmethod
+    def is_valid_size(size: Optional[str]) -> bool:
+        """Размер есть в справочнике"""
+        return bool(size) and size.lower() in VALID_SIZES
+
+    @staticmethod
+    def is_valid_color(color: Optional[str]) -> bool:
+        """Цвет есть в справочнике"""
+        return bool(color) and color.lower() in VALID_COLORS
+
+    def _extract(self, name: str) -> Dict[str, Optional[str]]:
+        size = self._find_size(name)
+        color = self._find_color(name)
+        clean_name = _CLEAN_SEPARATORS.sub(' ', _CLEAN_PARENS.sub('', name)).strip()
+        return {
+            'size': size,
+            'color': color,
+            'clean_name': clean_name,
+            # Нормализованные значения: синонимы (bordo/бордовый) дают один ключ
+            'size_key': normalize_size(size),
+            'color_key': color_synonym_key(color)
+        }
+
+    def _find_size(self, name: str) -> Optional[str]:
+        patterns = _ALL_SIZE_PATTERNS if _HAS_NUMBER.search(name) else _WORD_SIZE_PATTERNS
+        for pattern in patterns:
+            match = pattern.search(name)
+            if match:
+                size = match.group(1).strip()
+                if self.is_valid_size(size):
+                    return size
+        return None
+
+    def _find_color(self, name: str) -> Optional[str]:
+        if _COLOR_WORDS.isdisjoint(_WORDS.findall(name.lower())):
+            return None
+        for pattern in _COLOR_PATTERNS:
+            match = pattern.search(name)
+            if match:
+                color = match.group(1).strip()
+                if self.is_valid_color(color):
+                    return color
+        return None
@@ -0,0 +1,36 @@
+"""
+Битовые маски позиций товаров снимка (int, бит i - товар на позиции i)
+Разбор маски идет на стороне C: маска один раз переводится в байты 0/1 по позициям
+"""
+
+import itertools
+from typing import Iterable, List, Optional
+
+_BIT_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+_SKIP_CHUNK = 4096  # Байт флагов, пропускаемых за один подсчет при поиске offset
+
+
+def bitset(positions: Iterable[int], size: int) -> int:
+    """Битовая маска из позиций товаров (собирается за один проход)"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bit_positions(mask: int, limit: Optional[int] = None, offset: int = 0) -> List[int]:
+    """Позиции установленных битов по возрастанию: limit штук после первых offset
+
+    Первые offset битов не перебираются по одному: целые блоки флагов
+    пропускаются по их счетчику (bytes.count).
+    """
+    flags = bin(mask)[:1:-1].encode('ascii').translate(_BIT_FLAGS)
+    start = 0
+    while offset and start < len(flags):
+        count = flags.count(1, start, start + _SKIP_CHUNK)
+        if count > offset:
+            break
+        offset -= count
+        start += _SKIP_CHUNK
+    selected = itertools.compress(range(start, len(flags)), flags[start:])
+    return list(itertools.islice(selected, offset, None if limit is None else offset + limit))
@@ -0,0 +1,464 @@
+"""
+Снимок каталога товаров МойСклад
+Снимок строится целиком заново и публикуется заменой одной ссылки
+"""
+
+import base64
+import gzip
+import os
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Any, Iterable, List, Dict, Mapping, Optional, Tuple
+
+import json_codec
+from bitsets import bit_positions
+from facets import FacetIndex
+from search_index import SearchIndex, SuggestIndex
+from sorted_views import SortedViews
+
+# Версия формата файла снимка (при несовпадении файл игнорируется)
+SNAPSHOT_FORMAT = 1
+
+
+def _interned(values) -> Tuple[str, ...]:
+    """Кортеж строк из справочника: одинаковые размеры и цвета хранятся одним объектом"""
+    return tuple(sys.intern(value) for value in values)
+
+
+@dataclass(frozen=True, slots=True)
+class Variant:
+    """Модификация товара в наличии (цена берется из товара)"""
+
+    id: str
+    name: str
+    stock: int
+    sizes: Tuple[str, ...] = ()
+    colors: Tuple[str, ...] = ()
+
+    @classmethod
+    def create(cls, id: str, name: str, stock: int, sizes=(), colors=()) -> 'Variant':
+        return cls(id, name, stock, _interned(sizes), _interned(colors))
+
+    def to_dict(self, price: int) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'stock': self.stock,
+            'price': price,
+            'sizes': list(self.sizes),
+            'colors': list(self.colors)
+        }
+
+
+# Ячейка матрицы остатков: (ID модификации или None, если их несколько; остаток)
+StockCell = Tuple[Optional[str], int]
+_EMPTY_MATRIX: Mapping[Tuple[Optional[str], Optional[str]], StockCell] = MappingProxyType({})
+
+
+def build_stock_matrix(variants: Iterable[Variant]) -> Mapping[Tuple[Optional[str], Optional[str]], StockCell]:
+    """Матрица остатков товара: (цвет, размер) -> (ID модификации, остаток)
+
+    None вместо цвета или размера означает любое значение: (None, '44') -
+    суммарный остаток всех модификаций размера 44. Остатки нескольких
+    модификаций с одной ячейкой (в том числе с одной парой цвет и размер)
+    складываются, ID модификации у такой ячейки - None.
+    """
+    matrix: Dict[Tuple[Optional[str], Optional[str]], StockCell] = {}
+    
+    def add(key, variant):
+        known = matrix.get(key)
+        matrix[key] = (variant.id, variant.stock) if known is None else (None, known[1] + variant.stock)
+    
+    for variant in variants:
+        for color in variant.colors:
+            add((color, None), variant)
+            for size in variant.sizes:
+                add((color, size), variant)
+        for size in variant.sizes:
+            add((None, size), variant)
+    return MappingProxyType(matrix) if matrix else _EMPTY_MATRIX
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    """Товар опубликованного каталога
+
+    Неизменяемый: один объект без копирования отдается всем запросам и
+    переходит в следующий снимок, если товар не менялся. Ответ API
+    собирается из него методом to_dict.
+    """
+
+    id: str  # Исходное название товара (так исторически называется поле в API)
+    original_id: str  # ID товара в МойСклад
+    name: str
+    description: str
+    article: str
+    price: int
+    stock: int
+    category: str
+    available_colors: Tuple[str, ...] = ()
+    available_sizes: Tuple[str, ...] = ()
+    variants: Tuple[Variant, ...] = ()
+    image: Optional[str] = None
+    updated: str = ''  # Время последнего изменения товара в МойСклад (для сортировки по новизне)
+    stock_matrix: Mapping[Tuple[Optional[str], Optional[str]], StockCell] = field(default_factory=lambda: _EMPTY_MATRIX)
+
+    @classmethod
+    def create(cls, id: str, original_id: str, name: str, description: str, article: str, price: int,
+               stock: int, category: str, available_colors=(), available_sizes=(), variants=(),
+               image: Optional[str] = None, updated: Optional[str] = None) -> 'Product':
+        variants = tuple(variants)
+        return cls(
+            id, original_id, name, description, article, price, stock, sys.intern(category),
+            _interned(available_colors), _interned(available_sizes), variants, image, updated or '',
+            build_stock_matrix(variants)
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Product':
+        """Товар из словаря в формате API (снимок на диске)"""
+        variants = [
+            Variant.create(variant['id'], variant.get('name', ''), variant.get('stock', 0),
+                           variant.get('sizes') or (), variant.get('colors') or ())
+            for variant in data.get('variants') or ()
+        ]
+        return cls.create(
+            data['id'], data['original_id'], data['name'], data.get('description', ''), data.get('article', ''),
+            data.get('price', 0), data.get('stock', 0), data.get('category') or 'other',
+            data.get('available_colors') or (), data.get('available_sizes') or (), variants, data.get('image'),
+            data.get('updated')
+        )
+
+    def with_image(self, image: Optional[str]) -> 'Product':
+        return replace(self, image=image)
+
+    def stock_cell(self, color: Optional[str] = None, size: Optional[str] = None) -> Optional[StockCell]:
+        """(ID модификации, остаток) для цвета и/или размера, None - такой модификации нет"""
+        if not color and not size:
+            return (None, self.stock)
+        return self.stock_matrix.get((color or None, size or None))
+
+    def available(self, color: Optional[str] = None, size: Optional[str] = None) -> int:
+        """Доступный остаток по цвету и/или размеру (без них - остаток всего товара)"""
+        cell = self.stock_cell(color, size)
+        return cell[1] if cell is not None else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь в формате API (новый на каждый вызов, его можно изменять)"""
+        return {
+            'id': self.id,
+            'original_id': self.original_id,
+            'name': self.name,
+            'description': self.description,
+            'article': self.article,
+            'price': self.price,
+            'image': self.image,
+            'stock': self.stock,
+            'category': self.category,
+            'modifications_text': f"В наличии: {self.stock}",
+            'available_colors': list(self.available_colors),
+            'available_sizes': list(self.available_sizes),
+            'variants': [variant.to_dict(self.price) for variant in self.variants],
+            'updated': self.updated
+        }
+
+
+class CatalogSnapshot:
+    """Опубликованная версия каталога товаров"""
+
+    def __init__(self, products: List[Product], built_at: Optional[float] = None, version: Optional[str] = None):
+        self.products = products
+        # Индексы строятся один раз при публикации, запросы только читают их
+        self.by_id: Dict[str, Product] = {}
+        self.by_category: Dict[str, List[int]] = {}  # категория -> позиции товаров в products
+        self._positions: Dict[str, int] = {}
+        self._category_ranks: Dict[str, int] = {}  # ID товара -> номер товара в его категории
+        for position, product in enumerate(products):
+            product_id = product.original_id
+            self.by_id[product_id] = product
+            self._positions[product_id] = position
+            category_positions = self.by_category.setdefault(product.category, [])
+            self._category_ranks[product_id] = len(category_positions)
+            category_positions.append(position)
+        self._search_index: Optional[SearchIndex] = None
+        self._suggest_index: Optional[SuggestIndex] = None
+        self._facet_index: Optional[FacetIndex] = None
+        self._sorted_views: Optional[SortedViews] = None
+        self._sorted_facets: Dict[str, Tuple[List[int], FacetIndex]] = {}  # сортировка -> (перестановка, маски)
+        self.built_at = time.time() if built_at is None else built_at
+        # Версия уникальна для каждого опубликованного снимка
+        self.version = version or f"{time.time_ns():x}"
+
+    def __len__(self):
+        return len(self.products)
+
+    def age(self) -> float:
+        """Возраст снимка в секундах"""
+        return time.time() - self.built_at
+
+    def page(self, limit: int, offset: int) -> List[Product]:
+        """Срез товаров с пагинацией"""
+        return self.products[offset:offset + limit]
+
+    def get(self, product_id: str) -> Optional[Product]:
+        """Товар по ID МойСклад"""
+        return self.by_id.get(product_id)
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Поисковый индекс снимка (строится при первом обращении)"""
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.products)
+        return self._search_index
+
+    @property
+    def suggest_index(self) -> SuggestIndex:
+        """Индекс подсказок по префиксу (строится при первом обращении)"""
+        if self._suggest_index is None:
+            self._suggest_index = SuggestIndex(self.products)
+        return self._suggest_index
+
+    @property
+    def facet_index(self) -> FacetIndex:
+        """Битовые маски фасетов (строятся при первом обращении)"""
+        if self._facet_index is None:
+            self._facet_index = FacetIndex(self.products, self.sorted_views)
+        return self._facet_index
+
+    @property
+    def sorted_views(self) -> SortedViews:
+        """Перестановки товаров для сортировок (каждая строится при первом обращении)"""
+        if self._sorted_views is None:
+            self._sorted_views = SortedViews(self.products)
+        return self._sorted_views
+
+    def sorted_facet_index(self, sort: str,
+                           popularity: Optional[Mapping[str, int]] = None) -> Tuple[List[int], FacetIndex]:
+        """Перестановка сортировки и маски фасетов над товарами в ее порядке
+
+        Бит i такой маски - i-й товар в порядке сортировки, поэтому
+        отсортированная страница под фильтром - те же операции с масками,
+        что и без сортировки. Строится при первом обращении к сортировке и
+        заново, когда меняется ее перестановка (популярность).
+        ValueError для неизвестной сортировки.
+        """
+        order = self.sorted_views.order(sort, popularity)
+        cached = self._sorted_facets.get(sort)
+        if cached is None or cached[0] is not order:
+            cached = self._sorted_facets[sort] = (order, self.facet_index.reordered(self.products, order))
+        return cached
+
+    def filter_page(self, filters: Dict[str, List[str]], limit: int, offset: int = 0,
+                    sort: Optional[str] = None, popularity: Optional[Mapping[str, int]] = None,
+                    category: Optional[str] = None) -> Tuple[List[Product], int, Dict[str, List[Dict[str, Any]]]]:
+        """Страница товаров под фильтром фасетов, всего найдено и счетчики фасетов
+
+        category ограничивает выдачу и счетчики одной категорией (по И с
+        фильтром, в том числе с его фасетом category). Без sort товары идут
+        в порядке каталога.
+        """
+        order, facet_index = self.sorted_facet_index(sort, popularity) if sort else (None, self.facet_index)
+        scope = facet_index.category_mask(category) if category else None
+        mask, facets = facet_index.apply(filters, scope)
+        positions = bit_positions(mask, limit, offset)
+        if order is not None:
+            positions = [order[rank] for rank in positions]
+        return [self.products[position] for position in positions], mask.bit_count(), facets
+
+    def sorted_page(self, sort: str, category: Optional[str], limit: int, offset: int = 0,
+                    popularity: Optional[Mapping[str, int]] = None) -> Tuple[List[Product], int]:
+        """Страница категории (None - весь каталог) в порядке сортировки и число товаров
+
+        ValueError для неизвестной сортировки.
+        """
+        if not category:
+            positions = self.sorted_views.page(sort, limit, offset, popularity)
+            return [self.products[position] for position in positions], len(self.products)
+        order, facet_index = self.sorted_facet_index(sort, popularity)
+        mask = facet_index.category_mask(category)
+        return [self.products[order[rank]] for rank in bit_positions(mask, limit, offset)], mask.bit_count()
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[Product], int]:
+        """Страница результатов поиска и общее число найденных товаров"""
+        positions, total = self.search_index.page(query, limit, offset)
+        return [self.products[position] for position in positions], total
+
+    def category_page(self, category: Optional[str], limit: int, offset: int = 0,
+                      cursor: Optional[str] = None) -> Tuple[List[Product], Optional[str]]:
+        """Страница категории (None - весь каталог) и курсор следующей страницы
+
+        Курсор продолжает выдачу с места, где закончилась предыдущая
+        страница, даже если между запросами опубликован новый снимок: товар
+        не повторяется и не пропускается. Без курсора страница берется по
+        offset. Курсор None в ответе - страниц больше нет.
+        """
+        positions = self.by_category.get(category, ()) if category else range(len(self.products))
+        start = offset if cursor is None else self._resume_rank(category, decode_cursor(cursor))
+        chunk = positions[start:start + limit]
+        products = [self.products[position] for position in chunk]
+        end = start + len(chunk)
+        if end >= len(positions) or not products:
+            return products, None
+        return products, encode_cursor({
+            'v': self.version,
+            'c': category or '',
+            'o': end,
+            'a': products[-1].original_id
+        })
+
+    def _resume_rank(self, category: Optional[str], state: Dict[str, Any]) -> int:
+        """Номер товара в категории, с которого продолжается выдача по курсору"""
+        if state.get('c') != (category or ''):
+            raise ValueError("Курсор выдан для другой категории")
+        offset = state.get('o')
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Некорректный курсор")
+        if state.get('v') == self.version:
+            return offset
+        # Снимок сменился: продолжаем после последнего отданного товара, если он остался на месте
+        after = self.by_id.get(state.get('a'))
+        if after is not None and (not category or after.category == category):
+            ranks = self._category_ranks if category else self._positions
+            return ranks[after.original_id] + 1
+        return offset
+
+    def set_image(self, product_id: str, image: str) -> Optional[Product]:
+        """Подстановка изображения, загруженного после публикации снимка
+
+        Товар не изменяется, а заменяется новым объектом: запросы, которые
+        уже получили старый товар, видят его целиком.
+        """
+        product = self.by_id.get(product_id)
+        if product is None or product.image == image:
+            return product
+        updated = product.with_image(image)
+        self.products[self._positions[product_id]] = updated
+        self.by_id[product_id] = updated
+        return updated
+
+
+class CatalogSource:
+    """Исходные данные МойСклад, из которых собирается каталог
+
+    Хранится между синхронизациями, чтобы инкрементальное обновление
+    могло заменить только изменившиеся товары, модификации и остатки.
+    """
+
+    def __init__(self):
+        self.products: Dict[str, Dict] = {}  # product_id -> строка товара
+        self.variants: Dict[str, Dict] = {}  # variant_id -> строка модификации
+        self.variant_parent: Dict[str, str] = {}  # variant_id -> product_id
+        self.variants_by_product: Dict[str, Dict[str, None]] = {}  # product_id -> упорядоченное множество variant_id
+        self.stock: Dict[str, float] = {}  # id товара или модификации -> положительный остаток
+        self.updated_mark: Optional[str] = None  # Максимальное поле updated среди загруженных строк
+
+    def _bump_mark(self, row: Dict):
+        updated = row.get('updated')
+        if updated and (self.updated_mark is None or updated > self.updated_mark):
+            self.updated_mark = updated
+
+    def put_product(self, product: Dict):
+        """Добавление или замена товара"""
+        self.products[product['id']] = product
+        self._bump_mark(product)
+
+    def remove_product(self, product_id: str):
+        """Удаление товара (архивный или удаленный)"""
+        self.products.pop(product_id, None)
+
+    def put_variant(self, variant: Dict, product_id: str):
+        """Добавление или замена модификации с привязкой к родительскому товару"""
+        variant_id = variant['id']
+        old_parent = self.variant_parent.get(variant_id)
+        if old_parent is not None and old_parent != product_id:
+            self.variants_by_product.get(old_parent, {}).pop(variant_id, None)
+        self.variants[variant_id] = variant
+        self.variant_parent[variant_id] = product_id
+        self.variants_by_product.setdefault(product_id, {})[variant_id] = None
+        self._bump_mark(variant)
+
+    def remove_variant(self, variant_id: str):
+        """Удаление модификации"""
+        self.variants.pop(variant_id, None)
+        parent = self.variant_parent.pop(variant_id, None)
+        if parent is not None:
+            self.variants_by_product.get(parent, {}).pop(variant_id, None)
+
+    def variants_of(self, product_id: str) -> List[Dict]:
+        """Модификации товара в порядке загрузки"""
+        return [self.variants[variant_id] for variant_id in self.variants_by_product.get(product_id, ())]
+
+    def product_of(self, item_id: str) -> Optional[str]:
+        """ID товара, к которому относится остаток (товар или его модификация)"""
+        if item_id in self.products:
+            return item_id
+        return self.variant_parent.get(item_id)
+
+    def set_stock(self, item_id: str, quantity: float):
+        """Обновление остатка (неположительные остатки не хранятся)"""
+        if quantity > 0:
+            self.stock[item_id] = quantity
+        else:
+            self.stock.pop(item_id, None)
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Непрозрачный курсор пагинации из состояния выдачи"""
+    return base64.urlsafe_b64encode(json_codec.dumps(state)).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Состояние выдачи из курсора (ValueError, если курсор поврежден)"""
+    try:
+        state = json_codec.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if not isinstance(state, dict):
+        raise ValueError("Некорректный курсор")
+    return state
+
+
+# Пустой снимок до первой успешной загрузки каталога
+EMPTY_SNAPSHOT = CatalogSnapshot([], built_at=0, version='empty')
+
+
+def save_snapshot(path: str, snapshot: CatalogSnapshot, images: Dict[str, Dict]):
+    """Запись снимка и кэша изображений на диск (gzip JSON, атомарная замена файла)"""
+    payload = {
+        'format': SNAPSHOT_FORMAT,
+        'version': snapshot.version,
+        'built_at': snapshot.built_at,
+        'products': [product.to_dict() for product in snapshot.products],
+        'images': images
+    }
+    data = gzip.compress(json_codec.dumps(payload))
+    
+    # Пишем во временный файл и подменяем: при сбое остается предыдущий целый снимок
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Optional[Tuple[CatalogSnapshot, Dict[str, Dict]]]:
+    """Чтение снимка с диска: (снимок, кэш изображений) или None, если файла нет или он не подходит"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            payload = json_codec.loads(gzip.decompress(f.read()))
+    except (OSError, EOFError, ValueError) as e:
+        print(f"⚠️ Не удалось прочитать снимок каталога {path}: {e}")
+        return None
+    
+    if not isinstance(payload, dict) or payload.get('format') != SNAPSHOT_FORMAT:
+        print(f"⚠️ Снимок каталога {path} в устаревшем формате, пропускаем")
+        return None
+    
+    products = [Product.from_dict(product) for product in payload['products']]
+    snapshot = CatalogSnapshot(products, built_at=payload['built_at'], version=payload['version'])
+    return snapshot, payload.get('images') or {}
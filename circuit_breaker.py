@@ -0,0 +1,70 @@
+"""
+Предохранитель (circuit breaker) для запросов к МойСклад
+После серии ошибок запросы к хосту на время отклоняются сразу, без ожидания таймаутов
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: предохранитель разомкнут"""
+
+    def __init__(self, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(f"МойСклад недоступен, запросы приостановлены еще на {retry_in:.0f}с")
+
+
+class CircuitBreaker:
+    """Предохранитель по числу ошибок подряд
+
+    После failure_threshold ошибок подряд предохранитель размыкается, и
+    запросы отклоняются CircuitOpenError. Раз в reset_timeout секунд один
+    запрос пропускается как пробный: успех замыкает предохранитель,
+    ошибка оставляет его разомкнутым еще на reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self.last_failure: Optional[str] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self):
+        """Проверка перед запросом (CircuitOpenError, если запрос нельзя выполнять)"""
+        if self._opened_at is None:
+            return
+        retry_in = self._opened_at + self.reset_timeout - time.time()
+        if retry_in > 0:
+            raise CircuitOpenError(retry_in)
+        # Пробный запрос; следующий пробный - не раньше чем через reset_timeout
+        self._opened_at = time.time()
+
+    def record_success(self):
+        if self._opened_at is not None:
+            print("🟢 МойСклад снова отвечает, предохранитель замкнут")
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self, reason: str = ''):
+        self._failures += 1
+        self.last_failure = reason or None
+        if self._opened_at is not None:
+            self._opened_at = time.time()
+        elif self._failures >= self.failure_threshold:
+            self._opened_at = time.time()
+            print(f"🔴 МойСклад: {self._failures} ошибок подряд, запросы приостановлены на {self.reset_timeout}с")
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее состояние предохранителя"""
+        return {
+            'state': 'open' if self.is_open else 'closed',
+            'failures': self._failures,
+            'last_failure': self.last_failure,
+            'retry_in': round(max(0.0, self._opened_at + self.reset_timeout - time.time()), 1) if self.is_open else None
+        }
@@ -46,6 +46,10 @@ ALL_SIZES = {
     ]
 }
 
+# Множества допустимых значений в нижнем регистре (для быстрой проверки)
+VALID_COLORS = frozenset(color.lower() for group in ALL_COLORS.values() for color in group)
+VALID_SIZES = frozenset(size.lower() for group in ALL_SIZES.values() for size in group)
+
 # 🔗 НОРМАЛИЗАЦИЯ ЦВЕТОВ (приведение к единому виду)
 COLOR_NORMALIZATION = {
     # Русские -> Английские
@@ -107,6 +111,14 @@ COLOR_NORMALIZATION = {
     'dark-denim': 'dark-denim'
 }
 
+# 🔗 СИНОНИМЫ ЦВЕТОВ (одно написание цвета на разных языках и в транслитерации)
+# COLOR_NORMALIZATION сводит оттенки к семейству (голубой -> blue), а товар
+# в синем и голубом - две разные модификации, поэтому голубой здесь отдельный цвет
+COLOR_SYNONYMS = dict(COLOR_NORMALIZATION, **{
+    'голубой': 'light-blue',
+    'light-blue': 'light-blue'
+})
+
 # 📏 НОРМАЛИЗАЦИЯ РАЗМЕРОВ (приведение к единому виду)
 SIZE_NORMALIZATION = {
     # Числовые -> Числовые
@@ -146,6 +158,14 @@ def normalize_color(color):
     color_lower = color.lower()
     return COLOR_NORMALIZATION.get(color_lower, color_lower)
 
+def color_synonym_key(color):
+    """Ключ написания цвета: регистр, ё и язык не различаются, оттенки одного семейства различаются"""
+    if not color:
+        return None
+    
+    color_lower = color.lower().replace('ё', 'е')
+    return COLOR_SYNONYMS.get(color_lower, color_lower)
+
 def normalize_size(size):
     """Нормализовать размер (привести к единому виду)"""
     if not size:
@@ -159,16 +179,14 @@ def is_valid_color(color):
     if not color:
         return False
     
-    all_colors = get_all_colors()
-    return color.lower() in [c.lower() for c in all_colors]
+    return color.lower() in VALID_COLORS
 
 def is_valid_size(size):
     """Проверить, является ли размер валидным"""
     if not size:
         return False
     
-    all_sizes = get_all_sizes()
-    return size.lower() in [s.lower() for s in all_sizes]
+    return size.lower() in VALID_SIZES
 
 if __name__ == "__main__":
     print("🎨 СПРАВОЧНИК ЦВЕТОВ И РАЗМЕРОВ ИЗ МОЙСКЛАД")
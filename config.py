@@ -18,6 +18,24 @@ MOYSKLAD_PASSWORD = "Zxcx12321!!"  # Пароль от МойСклад
 # Web App Configuration
 WEBAPP_URL = os.getenv('WEBAPP_URL', 'https://your-webapp-url.com')  # URL вашего веб-приложения
 
+# Catalog Cache Configuration
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))  # Кэш каталога устаревает через 5 минут
+CATALOG_CACHE_HARD_TTL = int(os.getenv('CATALOG_CACHE_HARD_TTL', '3600'))  # Устаревший кэш отдается не дольше часа
+CATALOG_REFRESH_INTERVAL = int(os.getenv('CATALOG_REFRESH_INTERVAL', '300'))  # Фоновое обновление каталога раз в 5 минут
+CATALOG_REFRESH_RETRY_INTERVAL = int(os.getenv('CATALOG_REFRESH_RETRY_INTERVAL', '30'))  # Повтор после ошибки обновления
+CATALOG_FULL_RESYNC_INTERVAL = int(os.getenv('CATALOG_FULL_RESYNC_INTERVAL', '3600'))  # Между ними - инкрементальные обновления
+CATALOG_STOCK_REFRESH_INTERVAL = int(os.getenv('CATALOG_STOCK_REFRESH_INTERVAL', '60'))  # Остатки обновляются чаще каталога
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot.json.gz')  # Снимок каталога для быстрого старта, пустой - не сохранять
+
+# MoySklad Rate Limits (лимиты API на аккаунт)
+MOYSKLAD_RATE_LIMIT = int(os.getenv('MOYSKLAD_RATE_LIMIT', '45'))  # Запросов за период
+MOYSKLAD_RATE_LIMIT_PERIOD = int(os.getenv('MOYSKLAD_RATE_LIMIT_PERIOD', '3'))  # Период, секунды
+MOYSKLAD_MAX_PARALLEL = int(os.getenv('MOYSKLAD_MAX_PARALLEL', '5'))  # Параллельных запросов
+
+# MoySklad Webhooks
+MOYSKLAD_WEBHOOK_SECRET = os.getenv('MOYSKLAD_WEBHOOK_SECRET', '')  # Секрет в URL вебхука (?secret=...), пустой - вебхук отключен
+MOYSKLAD_WEBHOOK_DEBOUNCE = int(os.getenv('MOYSKLAD_WEBHOOK_DEBOUNCE', '2'))  # Пауза для сбора серии событий в одну пачку
+
 # Database Configuration
 DATABASE_PATH = "shop.db"
 
@@ -232,6 +232,33 @@ class Database:
         
         return order_id
     
+    def get_product_popularity(self):
+        """Популярность товаров: штук в корзинах и заказах по ID товара МойСклад"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # ID позиции корзины - original_id с цветом и размером через "_"
+        cursor.execute('SELECT product_id, SUM(quantity) FROM cart GROUP BY product_id')
+        rows = cursor.fetchall()
+        cursor.execute('SELECT items FROM orders')
+        orders = cursor.fetchall()
+        conn.close()
+
+        popularity = {}
+        for product_id, quantity in rows:
+            base_id = str(product_id).split('_')[0]
+            popularity[base_id] = popularity.get(base_id, 0) + (quantity or 0)
+        for (items,) in orders:
+            try:
+                items = json.loads(items or '[]')
+            except ValueError:
+                continue
+            for item in items if isinstance(items, list) else ():
+                if isinstance(item, dict) and item.get('product_id'):
+                    base_id = str(item['product_id']).split('_')[0]
+                    popularity[base_id] = popularity.get(base_id, 0) + (item.get('quantity') or 0)
+        return popularity
+
     def get_user_orders(self, user_id):
         """Получение заказов пользователя"""
         conn = sqlite3.connect(self.db_path)
@@ -0,0 +1,179 @@
+"""
+Фасеты каталога: категория, цвет, размер, диапазон цены и наличие
+Для каждого значения фасета хранится битовая маска позиций товаров в снимке (int)
+"""
+
+import copy
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bitsets import bit_positions, bitset
+from colors_sizes_reference import color_synonym_key, normalize_size
+from sorted_views import SortedViews
+
+# Границы ценовых диапазонов фасета (рубли), последний диапазон открыт сверху
+PRICE_BUCKETS = (0, 1000, 2000, 3000, 5000, 10000)
+
+FACETS = ('category', 'color', 'size', 'price', 'in_stock')
+
+
+def _price_bucket(price: float) -> str:
+    for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:]):
+        if price < high:
+            return f"{low}-{high}"
+    return f"{PRICE_BUCKETS[-1]}-"
+
+
+def _normalize(facet: str, value: str) -> str:
+    """Ключ значения фасета: синонимы цвета и размера (bordo/бордовый, OS/one size) дают один ключ"""
+    if facet == 'color':
+        return color_synonym_key(value) or ''
+    if facet == 'size':
+        return normalize_size(value) or ''
+    return value
+
+
+def parse_filter(text: Optional[str]) -> Dict[str, List[str]]:
+    """Разбор фильтра вида "color=white,black;size=42;price=1000-3000;in_stock=1"
+
+    Значения одного фасета объединяются по ИЛИ, разные фасеты - по И.
+    Цена "1000-3000" - от 1000 включительно до 3000 не включая.
+    ValueError, если фасет неизвестен или цена задана неверно.
+    """
+    filters: Dict[str, List[str]] = {}
+    for part in (text or '').split(';'):
+        if not part.strip():
+            continue
+        name, separator, values = part.partition('=')
+        name = name.strip()
+        if not separator or name not in FACETS:
+            raise ValueError(f"Неизвестный фильтр: {part.strip()}")
+        values = [value.strip() for value in values.split(',') if value.strip()]
+        if name == 'price':
+            for value in values:
+                parse_price_range(value)
+        filters.setdefault(name, []).extend(values)
+    return filters
+
+
+def parse_price_range(value: str) -> Tuple[float, float]:
+    """Диапазон цены "от-до": от <= цена < до, как у диапазонов фасета (любая граница может быть пустой)"""
+    low, separator, high = value.partition('-')
+    try:
+        return (float(low) if low else 0.0, float(high) if high else float('inf'))
+    except ValueError:
+        raise ValueError(f"Неверный диапазон цены: {value}") from None
+
+
+class FacetIndex:
+    """Битовые маски значений фасетов для одного снимка каталога
+
+    Фильтр - пересечение масок (И между фасетами, ИЛИ внутри фасета).
+    Счетчики фасета считаются с фильтрами всех остальных фасетов, поэтому
+    в каждом фасете видно, сколько товаров останется при выборе значения.
+    """
+
+    def __init__(self, products: Sequence, views: Optional[SortedViews] = None):
+        # Произвольные ценовые диапазоны ищутся бинарным поиском по отсортированным ценам
+        self._views = views or SortedViews(products)
+        self.size = len(products)
+        self.all = (1 << self.size) - 1
+        positions: Dict[str, Dict[str, List[int]]] = {facet: {} for facet in FACETS}
+        self.labels: Dict[str, Dict[str, str]] = {facet: {} for facet in FACETS}
+        for position, product in enumerate(products):
+            values = {
+                'category': (product.category,),
+                'color': product.available_colors,
+                'size': product.available_sizes,
+                'price': (_price_bucket(product.price),),
+                'in_stock': ('1' if product.stock > 0 else '0',)
+            }
+            for facet, facet_values in values.items():
+                for value in facet_values:
+                    key = _normalize(facet, value)
+                    if not key:
+                        continue
+                    # Подпись - первое встреченное написание значения
+                    self.labels[facet].setdefault(key, value)
+                    facet_positions = positions[facet].setdefault(key, [])
+                    if not facet_positions or facet_positions[-1] != position:
+                        facet_positions.append(position)
+        self.masks: Dict[str, Dict[str, int]] = {
+            facet: {key: bitset(facet_positions, self.size) for key, facet_positions in values.items()}
+            for facet, values in positions.items()
+        }
+
+    def reordered(self, products: Sequence, order: Sequence[int]) -> 'FacetIndex':
+        """Те же фасеты для товаров в порядке order: бит i новой маски - товар order[i]
+
+        Маски переставляются из готовых, товары заново не разбираются.
+        """
+        rank = [0] * self.size
+        for position_rank, position in enumerate(order):
+            rank[position] = position_rank
+        index = copy.copy(self)
+        index._views = SortedViews([products[position] for position in order])
+        index.masks = {
+            facet: {key: bitset((rank[position] for position in bit_positions(mask)), self.size)
+                    for key, mask in values.items()}
+            for facet, values in self.masks.items()
+        }
+        return index
+
+    def counts(self, facet: str, mask: Optional[int] = None) -> Dict[str, int]:
+        """Число товаров с каждым значением фасета внутри маски"""
+        mask = self.all if mask is None else mask
+        return {key: (value_mask & mask).bit_count() for key, value_mask in self.masks[facet].items()}
+
+    def _facet_mask(self, facet: str, values: List[str]) -> int:
+        """Маска товаров, подходящих хотя бы под одно значение фасета"""
+        if facet == 'price':
+            return self._price_mask(values)
+        mask = 0
+        for value in values:
+            mask |= self.masks[facet].get(_normalize(facet, value), 0)
+        return mask
+
+    def _price_mask(self, ranges: List[str]) -> int:
+        """Маска по ценовым диапазонам [от, до): готовые диапазоны фасета берутся из масок"""
+        mask = 0
+        bounds = []
+        for value in ranges:
+            if value in self.masks['price']:
+                mask |= self.masks['price'][value]
+            else:
+                bounds.append(parse_price_range(value))
+        for low, high in bounds:
+            mask |= bitset(self._views.price_range(low, high), self.size)
+        return mask
+
+    def category_mask(self, category: str) -> int:
+        """Маска товаров категории"""
+        return self.masks['category'].get(category, 0)
+
+    def apply(self, filters: Dict[str, List[str]],
+              scope: Optional[int] = None) -> Tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        """Маска товаров под фильтром и счетчики по всем фасетам
+
+        scope - маска, которой ограничены и товары, и счетчики (например,
+        категория из адреса страницы); с фильтрами она объединяется по И.
+        """
+        base = self.all if scope is None else scope
+        facet_masks = {facet: self._facet_mask(facet, values) for facet, values in filters.items() if values}
+        mask = base
+        for facet_mask in facet_masks.values():
+            mask &= facet_mask
+
+        facets = {}
+        for facet in FACETS:
+            # Счетчики фасета не учитывают его собственный фильтр
+            other_mask = base
+            for other, facet_mask in facet_masks.items():
+                if other != facet:
+                    other_mask &= facet_mask
+            counts = self.counts(facet, other_mask)
+            facets[facet] = [
+                {'value': key, 'label': self.labels[facet][key], 'count': count}
+                for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+                if count
+            ]
+        return mask, facets
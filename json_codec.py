@@ -0,0 +1,41 @@
+"""
+Быстрый JSON: orjson, если установлен, иначе стандартный json
+Используется для ответов МойСклад, ответов API и снимка каталога на диске
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализация в UTF-8 JSON без пробелов (как у JSONResponse FastAPI)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """Разбор JSON из bytes или str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с сериализацией через dumps
+
+    Если обработчик возвращает этот ответ сам, FastAPI пропускает
+    jsonable_encoder, и данные сериализуются за один проход.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
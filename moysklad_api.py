@@ -1,57 +1,298 @@
 import aiohttp
+import asyncio
+import collections
+import contextlib
+import itertools
+import random
 import time
-import re
-import requests
-import base64
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from catalog import CatalogSnapshot, CatalogSource, Product, Variant, EMPTY_SNAPSHOT, save_snapshot, load_snapshot
+from token_manager import TokenManager
+from rate_limiter import RateLimiter, PRIORITY_NORMAL, PRIORITY_LOW
+from circuit_breaker import CircuitBreaker
+from attribute_extractor import AttributeExtractor
+from colors_sizes_reference import color_synonym_key, normalize_size
+from sorted_views import SORT_PRICE_ASC, SORT_PRICE_DESC, SORT_NEWEST, SORT_IN_STOCK_FIRST
+import json_codec
+
+# МойСклад принимает и отдает даты по московскому времени
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+# Ответы МойСклад, после которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# Документы МойСклад, проведение которых меняет остатки (события вебхуков)
+STOCK_DOCUMENT_TYPES = frozenset({
+    'demand', 'supply', 'enter', 'loss', 'move', 'inventory',
+    'retaildemand', 'retailsalesreturn', 'salesreturn', 'purchasereturn',
+    'processing'
+})
+
+
+class MoySkladAPIError(Exception):
+    """Ошибка ответа API МойСклад"""
+
+    def __init__(self, status: int, message: str = ''):
+        self.status = status
+        self.message = message
+        super().__init__(f"МойСклад вернул {status}: {message[:200]}")
+
 
 class MoySkladAPI:
     def __init__(self, api_token: str = None):
+        from config import (
+            CATALOG_CACHE_TTL, CATALOG_CACHE_HARD_TTL,
+            CATALOG_REFRESH_INTERVAL, CATALOG_REFRESH_RETRY_INTERVAL,
+            CATALOG_FULL_RESYNC_INTERVAL, CATALOG_STOCK_REFRESH_INTERVAL,
+            CATALOG_SNAPSHOT_PATH, MOYSKLAD_WEBHOOK_DEBOUNCE
+        )
+        
+        from config import (
+            MOYSKLAD_LOGIN, MOYSKLAD_PASSWORD,
+            MOYSKLAD_RATE_LIMIT, MOYSKLAD_RATE_LIMIT_PERIOD, MOYSKLAD_MAX_PARALLEL
+        )
+        
         if api_token is None:
             from config import MOYSKLAD_API_TOKEN
             api_token = MOYSKLAD_API_TOKEN
             
-        self.api_token = api_token
         self.base_url = "https://api.moysklad.ru/api/remap/1.2"
-        self.headers = {
-            'Authorization': f'Bearer {api_token}' if api_token else '',
-            'Accept': 'application/json;charset=utf-8',
-            'Accept-Encoding': 'gzip'
-        }
+        # Токен обновляется только по ответу 401, без проверочных запросов
+        self._tokens = TokenManager(
+            api_token,
+            token_url=f"{self.base_url}/security/token",
+            get_session=self.get_session,
+            login=MOYSKLAD_LOGIN,
+            password=MOYSKLAD_PASSWORD
+        )
         
-        # Кэширование
-        self._products_cache = []
-        self._cache_timestamp = 0
-        self._cache_ttl = 300  # 5 минут
+        # Кэширование: опубликованный снимок каталога заменяется целиком
+        self._snapshot = EMPTY_SNAPSHOT
+        self._cache_ttl = CATALOG_CACHE_TTL  # Через сколько секунд кэш считается устаревшим
+        self._cache_hard_ttl = CATALOG_CACHE_HARD_TTL  # Дольше этого устаревший кэш не отдается
+        self._refresh_task: Optional[asyncio.Task] = None  # Текущее обновление каталога (single-flight)
+        self._synced_at = 0  # Время последней успешной синхронизации (полной или инкрементальной)
+        
+        # Снимок на диске: загружается при старте, перезаписывается после обновлений
+        self._snapshot_path = CATALOG_SNAPSHOT_PATH
+        self._snapshot_save_delay = 5  # Секунды: серия обновлений записывается одним файлом
+        self._snapshot_dirty = False
+        self._snapshot_save_task: Optional[asyncio.Task] = None
+        
+        # Исходные данные для инкрементальной синхронизации по полю updated
+        self._source: Optional[CatalogSource] = None
+        self._stock_mark: Optional[str] = None  # changedSince для остатков (МСК)
+        self._stock_mark_overlap = 60  # Перекрытие окна остатков, секунды
+        self._last_full_sync = 0
+        self._full_resync_interval = CATALOG_FULL_RESYNC_INTERVAL  # Полная пересборка как страховка
+        self._full_sync_requested = False
+        self._variant_attributes_cache = {}  # variant_id -> (updated, размеры и цвета)
+        self._attributes = AttributeExtractor()  # Разбор названий с запоминанием результатов
+        
+        # Быстрое обновление только остатков (свой, более короткий интервал)
+        self._stock_refresh_interval = CATALOG_STOCK_REFRESH_INTERVAL
+        self._stock_synced_at = 0
+        self._stock_refresh_task: Optional[asyncio.Task] = None
+        self._stock_scheduler_task: Optional[asyncio.Task] = None
+        self._sync_lock = asyncio.Lock()  # Синхронизации каталога и остатков не пересекаются
+        
+        # Точечные обновления по вебхукам МойСклад (пачками после паузы)
+        self._webhook_debounce = MOYSKLAD_WEBHOOK_DEBOUNCE
+        self._webhook_products = set()  # ID товаров, ожидающих обновления
+        self._webhook_variants = set()  # ID модификаций, ожидающих обновления
+        self._webhook_stock = False  # Пришел документ, меняющий остатки
+        self._webhook_task: Optional[asyncio.Task] = None
+        
+        # Фоновое обновление каталога по расписанию (запускается из lifespan)
+        self._refresh_interval = CATALOG_REFRESH_INTERVAL
+        self._refresh_retry_interval = CATALOG_REFRESH_RETRY_INTERVAL
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._refresh_requested = asyncio.Event()
+        self.refresh_status = {
+            'running': False,
+            'last_started': None,
+            'last_success': None,
+            'last_duration': None,
+            'last_error': None,
+            'last_error_at': None,
+            'last_mode': None,
+            'last_full_sync': None,
+            'last_stock_refresh': None,
+            'last_stock_duration': None,
+            'last_webhook_refresh': None,
+            'products': 0,
+            'version': EMPTY_SNAPSHOT.version
+        }
         
         # Кэш для изображений
         self._images_cache = {}
         self._images_cache_ttl = 3600  # 1 час для изображений
+        self._pending_images = {}  # product_id -> товар, чье изображение еще не загружено
+        self._image_tasks = set()  # Фоновые задачи загрузки изображений
+        self._image_concurrency = 8  # Параллельных запросов метаданных изображений
+        self._image_semaphore = asyncio.Semaphore(self._image_concurrency)
+        
+        # Общая HTTP-сессия с пулом keep-alive соединений (открывается в lifespan)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self._connection_limit = 100  # Всего соединений в пуле
+        self._connection_limit_per_host = 20  # Соединений на один хост
+        self._dns_cache_ttl = 300  # Кэш DNS, секунды
+        self._keepalive_timeout = 60  # Время жизни простаивающего соединения, секунды
+        self._http_timeout = aiohttp.ClientTimeout(total=60, connect=10, sock_read=30)
+        self._page_concurrency = 4  # Параллельных запросов страниц на один список
+        
+        # Общий для всех запросов ограничитель частоты и параллельности
+        self._rate_limiter = RateLimiter(MOYSKLAD_RATE_LIMIT, MOYSKLAD_RATE_LIMIT_PERIOD, MOYSKLAD_MAX_PARALLEL)
+        self._rate_limit_retries = 3  # Повторов после ответа 429
+        
+        # Повторы при сбоях сети и 5xx и предохранитель на весь хост МойСклад
+        self._max_retries = 3
+        self._retry_base_delay = 0.5  # Секунды, удваивается с каждой попыткой
+        self._retry_max_delay = 8
+        self._circuit = CircuitBreaker(failure_threshold=5, reset_timeout=30)
         
         # Инициализация базы данных
         from database import Database
         self.db = Database()
-        
-        # Попытка обновить токен при инициализации
-        self._refresh_token_if_needed()
+
+    @property
+    def api_token(self) -> Optional[str]:
+        """Текущий токен доступа МойСклад"""
+        return self._tokens.token
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Заголовки запросов к API МойСклад с текущим токеном"""
+        return {
+            **self._tokens.auth_header(),
+            'Accept': 'application/json;charset=utf-8',
+            'Accept-Encoding': 'gzip'
+        }
+
+    async def start(self):
+        """Открытие общей HTTP-сессии (вызывается из lifespan приложения)"""
+        await self.get_session()
+
+    async def close(self):
+        """Закрытие общей HTTP-сессии и пула соединений"""
+        # Фоновые загрузки отменяются до закрытия сессии, иначе они упадут на закрытой сессии
+        await self._cancel_tasks(self._refresh_task, self._stock_refresh_task, self._webhook_task, *self._image_tasks)
+        self._refresh_task = None
+        self._stock_refresh_task = None
+        self._webhook_task = None
+        if self._snapshot_save_task is not None and not self._snapshot_save_task.done():
+            # Дописываем последний снимок, а не теряем его при остановке
+            await self._snapshot_save_task
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            print("🔌 HTTP-сессия МойСклад закрыта")
+        self._session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Получение общей HTTP-сессии (создается лениво, если lifespan не запускался)"""
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self._connection_limit,
+                    limit_per_host=self._connection_limit_per_host,
+                    ttl_dns_cache=self._dns_cache_ttl,
+                    keepalive_timeout=self._keepalive_timeout
+                )
+                self._session = aiohttp.ClientSession(connector=connector, timeout=self._http_timeout)
+                print("🔌 Открыта HTTP-сессия МойСклад с пулом соединений")
+        return self._session
+
+    def _cache_age(self) -> float:
+        """Сколько секунд прошло с последней успешной синхронизации"""
+        return time.time() - self._synced_at
 
     def _is_cache_valid(self):
         """Проверка валидности кэша"""
-        return (time.time() - self._cache_timestamp) < self._cache_ttl
-
-    def _get_cached_products(self, limit: int, offset: int) -> List[Dict]:
-        """Получение товаров из кэша с пагинацией"""
-        start = offset
-        end = offset + limit
-        return self._products_cache[start:end]
+        return self._cache_age() < self._cache_ttl
 
     def clear_cache(self):
         """Очистка кэша товаров"""
-        self._products_cache = []
-        self._cache_timestamp = 0
+        self._snapshot = EMPTY_SNAPSHOT
+        self._synced_at = 0
+        self._stock_synced_at = 0
         print("🗑️ Кэш товаров очищен")
     
+    def load_snapshot(self) -> bool:
+        """Загрузка сохраненного снимка каталога с диска (вызывается до приема запросов)"""
+        if not self._snapshot_path:
+            return False
+        loaded = load_snapshot(self._snapshot_path)
+        if loaded is None:
+            return False
+        
+        snapshot, images = loaded
+        self._snapshot = snapshot
+        self._images_cache.update(images)
+        # Возраст кэша считаем от сборки снимка, а не от загрузки файла
+        self._synced_at = snapshot.built_at
+        self.refresh_status.update(products=len(snapshot), version=snapshot.version)
+        print(f"💾 Снимок каталога загружен с диска: {len(snapshot)} товаров, возраст {int(snapshot.age())}с")
+        return True
+
+    def _publish_snapshot(self, snapshot: CatalogSnapshot):
+        """Публикация нового снимка каталога и его сохранение на диск в фоне"""
+        # Атомарная замена: читатели видят либо старый, либо новый снимок целиком
+        self._snapshot = snapshot
+        self._schedule_snapshot_save()
+        # Поисковый индекс строится сразу после публикации, а не в первом поисковом запросе
+        asyncio.get_running_loop().call_soon(self._warm_search_index, snapshot)
+
+    def _warm_search_index(self, snapshot: CatalogSnapshot):
+        """Построение поискового индекса снимка, если он еще актуален"""
+        if snapshot is not self._snapshot:
+            return
+        started = time.time()
+        index = snapshot.search_index
+        suggestions = snapshot.suggest_index
+        facets = snapshot.facet_index
+        print(f"🔎 Поисковый индекс построен за {time.time() - started:.3f}с: "
+              f"терминов {len(index)}, ключей подсказок {len(suggestions)}, "
+              f"значений фасетов {sum(len(values) for values in facets.masks.values())}")
+        self._warm_sorted_views(snapshot, [SORT_PRICE_ASC, SORT_PRICE_DESC, SORT_NEWEST, SORT_IN_STOCK_FIRST])
+
+    def _warm_sorted_views(self, snapshot: CatalogSnapshot, sorts: List[str]):
+        """Построение масок сортировок по одной за итерацию цикла, чтобы не задерживать запросы"""
+        if not sorts or snapshot is not self._snapshot:
+            return
+        snapshot.sorted_facet_index(sorts[0])
+        asyncio.get_running_loop().call_soon(self._warm_sorted_views, snapshot, sorts[1:])
+
+    def _schedule_snapshot_save(self):
+        """Отложенная запись текущего снимка на диск (одна задача на серию изменений)"""
+        if not self._snapshot_path:
+            return
+        self._snapshot_dirty = True
+        if self._snapshot_save_task is None or self._snapshot_save_task.done():
+            self._snapshot_save_task = asyncio.create_task(self._save_snapshot())
+
+    async def _save_snapshot(self):
+        """Запись снимка на диск, пока есть несохраненные изменения"""
+        while self._snapshot_dirty:
+            await asyncio.sleep(self._snapshot_save_delay)
+            self._snapshot_dirty = False
+            snapshot = self._snapshot
+            if not snapshot.products:
+                continue
+            images = dict(self._images_cache)
+            try:
+                started = time.time()
+                # Сериализация и сжатие не должны блокировать event loop
+                await asyncio.to_thread(save_snapshot, self._snapshot_path, snapshot, images)
+                print(f"💾 Снимок каталога сохранен на диск за {time.time() - started:.2f}с")
+            except Exception as e:
+                print(f"⚠️ Не удалось сохранить снимок каталога: {e}")
+
     def clear_images_cache(self):
         """Очистка кэша изображений"""
         self._images_cache.clear()
@@ -66,434 +307,1121 @@ class MoySkladAPI:
 
     def force_refresh_products(self):
         """Принудительное обновление кэша товаров"""
+        self._full_sync_requested = True
+        if self._scheduler_task is not None:
+            # Планировщик пересоберет каталог, текущий снимок продолжает отдаваться
+            self._refresh_requested.set()
+            print("🔄 Запрошено внеочередное обновление каталога")
+            return
         self.clear_cache()
         print("🔄 Принудительное обновление кэша товаров")
 
+    async def start_scheduler(self):
+        """Запуск фонового обновления каталога (первая загрузка - до приема запросов)"""
+        if self._scheduler_task is not None:
+            return
+        if self._snapshot.products:
+            # Каталог уже загружен с диска: первое обновление идет в фоне
+            self._refresh_requested.set()
+        else:
+            await self._run_scheduled_refresh()
+        self._scheduler_task = asyncio.create_task(self._scheduler_loop())
+        self._stock_scheduler_task = asyncio.create_task(self._stock_scheduler_loop())
+        print(f"⏰ Планировщик каталога запущен (интервал {self._refresh_interval}с, остатки - {self._stock_refresh_interval}с)")
+
+    async def stop_scheduler(self):
+        """Остановка фонового обновления каталога"""
+        if self._scheduler_task is None:
+            return
+        # Вместе с циклами останавливаются и запущенные ими обновления
+        await self._cancel_tasks(self._scheduler_task, self._stock_scheduler_task,
+                                 self._refresh_task, self._stock_refresh_task)
+        self._scheduler_task = None
+        self._stock_scheduler_task = None
+        self._refresh_task = None
+        self._stock_refresh_task = None
+        print("⏰ Планировщик каталога остановлен")
+
+    async def _cancel_tasks(self, *tasks: Optional[asyncio.Task]):
+        """Отмена фоновых задач и ожидание их завершения (ошибки задач не пробрасываются)"""
+        tasks = [task for task in tasks if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _scheduler_loop(self):
+        """Цикл обновления: по интервалу или по запросу force_refresh_products"""
+        while True:
+            # После ошибки повторяем раньше обычного интервала
+            interval = self._refresh_interval if self.refresh_status['last_error'] is None else self._refresh_retry_interval
+            try:
+                await asyncio.wait_for(self._refresh_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_requested.clear()
+            await self._run_scheduled_refresh()
+
+    async def _stock_scheduler_loop(self):
+        """Цикл быстрого обновления остатков между обновлениями каталога"""
+        while True:
+            await asyncio.sleep(self._stock_refresh_interval)
+            if not self._is_stock_stale():
+                # Остатки уже подтянула синхронизация каталога
+                continue
+            try:
+                await self._start_stock_refresh()
+            except Exception:
+                pass
+
+    async def _run_scheduled_refresh(self):
+        """Одно обновление каталога из планировщика (ошибки уже залогированы)"""
+        try:
+            await self._start_products_refresh()
+        except Exception:
+            pass
+
+    def get_refresh_status(self) -> Dict[str, Any]:
+        """Состояние фонового обновления каталога"""
+        status = dict(self.refresh_status)
+        status['scheduler'] = self._scheduler_task is not None
+        status['stock_age'] = int(time.time() - self._stock_synced_at) if self._stock_synced_at else None
+        status['rate_limit'] = self._rate_limiter.stats()
+        status['circuit'] = self._circuit.stats()
+        status['webhook_pending'] = len(self._webhook_products) + len(self._webhook_variants) + int(self._webhook_stock)
+        status['age'] = int(self._cache_age()) if self._snapshot.products else None
+        return status
+
     async def get_products(self, limit=50, offset=0):
-        """Получение списка товаров с кэшированием"""
+        """Получение списка товаров с кэшированием (в формате API)"""
         print(f"🔍 Запрос товаров: limit={limit}, offset={offset}")
+        try:
+            snapshot = await self._fresh_snapshot()
+        except Exception as e:
+            print(f"❌ Ошибка получения товаров: {e}")
+            return self._get_test_products()
+        return [product.to_dict() for product in snapshot.page(limit, offset)]
+
+    async def get_category_page(self, category: Optional[str], limit: int = 50, offset: int = 0,
+                                cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Страница товаров категории (None - весь каталог) и курсор следующей страницы
+
+        ValueError, если курсор поврежден или выдан для другой категории.
+        """
+        try:
+            snapshot = await self._fresh_snapshot()
+        except Exception as e:
+            print(f"❌ Ошибка получения товаров: {e}")
+            products = [product for product in self._get_test_products() if not category or product['category'] == category]
+            return products[offset:offset + limit], None
+        products, next_cursor = snapshot.category_page(category, limit, offset, cursor)
+        return [product.to_dict() for product in products], next_cursor
+
+    async def filter_products(self, filters: Dict[str, List[str]], limit: int = 50, offset: int = 0,
+                              sort: Optional[str] = None, popularity: Optional[Dict[str, int]] = None,
+                              category: Optional[str] = None) -> Tuple[List[Dict], int, Dict[str, List[Dict]]]:
+        """Товары под фильтром фасетов: (страница товаров, всего найдено, счетчики фасетов)
+
+        category ограничивает выдачу одной категорией независимо от фильтра.
+        """
+        snapshot = await self.get_snapshot()
+        products, total, facets = snapshot.filter_page(filters, limit, offset, sort, popularity, category)
+        return [product.to_dict() for product in products], total, facets
+
+    async def get_sorted_page(self, sort: str, category: Optional[str], limit: int = 50, offset: int = 0,
+                              popularity: Optional[Dict[str, int]] = None) -> Tuple[List[Dict], int]:
+        """Страница категории (None - весь каталог) в порядке сортировки: (товары, всего товаров)"""
+        snapshot = await self.get_snapshot()
+        products, total = snapshot.sorted_page(sort, category, limit, offset, popularity)
+        return [product.to_dict() for product in products], total
+
+    async def get_category_counts(self) -> Dict[str, int]:
+        """Число товаров в наличии по категориям (из масок фасетов)"""
+        snapshot = await self.get_snapshot()
+        facet_index = snapshot.facet_index
+        in_stock = facet_index.masks['in_stock'].get('1', 0)
+        return {category: count for category, count in facet_index.counts('category', in_stock).items() if count}
+
+    async def search_products(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """Поиск товаров по каталогу: (страница товаров, всего найдено)"""
+        snapshot = await self.get_snapshot()
+        products, total = snapshot.search(query, limit, offset)
+        return [product.to_dict() for product in products], total
+
+    async def suggest(self, prefix: str, limit: int = 5) -> Dict[str, List[Dict]]:
+        """Подсказки для строки поиска по началу слова"""
+        snapshot = await self.get_snapshot()
+        return snapshot.suggest_index.suggest(prefix, limit)
+
+    async def get_snapshot(self) -> CatalogSnapshot:
+        """Актуальный снимок каталога с индексами для поиска товаров
+
+        Если каталог загрузить не удалось и снимка нет, возвращается пустой снимок.
+        """
+        try:
+            return await self._fresh_snapshot()
+        except Exception as e:
+            print(f"❌ Ошибка получения каталога: {e}")
+            return self._snapshot
+
+    async def _fresh_snapshot(self) -> CatalogSnapshot:
+        """Снимок каталога с учетом срока жизни кэша
+
+        Устаревший кэш отдается сразу, а обновление запускается в фоне одной
+        общей задачей на всех (single-flight). Вызывающий ждет обновления
+        только если кэша нет или он старше жесткого срока self._cache_hard_ttl.
+        Если запущен планировщик, запрос никогда не запускает обновление сам.
+        Исключение - только если обновление не удалось и снимка нет.
+        """
+        # Каталог обновляет планировщик, пользовательский запрос только читает снимок
+        if self._scheduler_task is not None:
+            return self._snapshot
         
         # Проверяем кэш
         if self._is_cache_valid():
-            print(f"⚡ Используем кэш товаров (возраст: {int(time.time() - self._cache_timestamp)}с)")
-            return self._get_cached_products(limit, offset)
+            print(f"⚡ Используем кэш товаров (возраст: {int(self._cache_age())}с)")
+            if self._is_stock_stale():
+                # Остатки живут меньше каталога: обновляем их в фоне, не задерживая ответ
+                self._start_stock_refresh()
+            return self._snapshot
         
-        print("🔄 Кэш устарел, загружаем новые данные...")
+        refresh_task = self._start_products_refresh()
+        
+        if self._snapshot.products and not self._is_cache_expired():
+            print(f"♻️ Отдаем устаревший кэш (возраст: {int(self._cache_age())}с), обновление идет в фоне")
+            return self._snapshot
+        
+        print("⏳ Кэш пуст или истек, ждем обновления...")
         
         try:
-            # Получаем родительские товары (products)
-            products_data = await self._get_products_info()
-            print(f"🛍️ Получено родительских товаров: {len(products_data)}")
+            # shield: отмена одного запроса не должна отменять общее обновление
+            await asyncio.shield(refresh_task)
+        except Exception:
+            if not self._snapshot.products:
+                raise
+            # Последний успешный каталог, даже старше жесткого срока, лучше демо-товаров
+            print(f"↩️ Отдаем последний успешный каталог (возраст: {int(self._cache_age())}с)")
+        return self._snapshot
+
+    def _is_cache_expired(self):
+        """Проверка жесткого срока жизни кэша (дольше устаревший кэш не отдается)"""
+        return self._cache_age() >= self._cache_hard_ttl
+
+    def _needs_full_sync(self) -> bool:
+        """Нужна ли полная синхронизация вместо инкрементальной"""
+        return (
+            self._full_sync_requested
+            or self._source is None
+            or self._source.updated_mark is None
+            or self._stock_mark is None
+            or time.time() - self._last_full_sync >= self._full_resync_interval
+        )
+
+    def _start_products_refresh(self) -> asyncio.Task:
+        """Запуск обновления каталога или присоединение к уже идущему"""
+        if self._refresh_task is None or self._refresh_task.done():
+            full = self._needs_full_sync()
+            print(f"🔄 Кэш устарел, загружаем новые данные ({'полная' if full else 'инкрементальная'} синхронизация)...")
+            self._refresh_task = asyncio.create_task(self._rebuild_products(full))
+            self._refresh_task.add_done_callback(self._on_products_refresh_done)
+        return self._refresh_task
+
+    def _on_products_refresh_done(self, task: asyncio.Task):
+        """Логирование результата фонового обновления каталога"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"❌ Ошибка обновления каталога: {error}")
+            import traceback
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    async def _rebuild_products(self, full: bool = True):
+        """Загрузка каталога из МойСклад (полная или инкрементальная) и публикация нового снимка"""
+        started = time.time()
+        mode = 'full' if full else 'delta'
+        self.refresh_status.update(running=True, last_started=started)
+        try:
+            async with self._sync_lock:
+                if full:
+                    self._full_sync_requested = False
+                    products = await self._build_catalog()
+                    self._last_full_sync = started
+                else:
+                    products = await self._delta_catalog()
+        except Exception as e:
+            self.refresh_status.update(running=False, last_error=str(e) or type(e).__name__, last_error_at=time.time())
+            raise
+        
+        self._synced_at = time.time()
+        if products is not None:
+            self._publish_snapshot(CatalogSnapshot(products))
+            print(f"💾 Товары закэшированы ({len(products)} шт.)")
+        else:
+            print("✅ Изменений в МойСклад нет, снимок каталога не меняется")
+        
+        self.refresh_status.update(
+            running=False,
+            last_success=time.time(),
+            last_duration=round(time.time() - started, 3),
+            last_error=None,
+            last_mode=mode,
+            last_full_sync=self._last_full_sync or None,
+            products=len(self._snapshot),
+            version=self._snapshot.version
+        )
+        
+        # Изображения догружаются в фоне, каталог уже опубликован
+        self._schedule_image_resolution()
+
+    def _is_stock_stale(self) -> bool:
+        """Остатки старше интервала быстрого обновления"""
+        return time.time() - self._stock_synced_at >= self._stock_refresh_interval
+
+    def _start_stock_refresh(self) -> asyncio.Task:
+        """Запуск обновления остатков или присоединение к уже идущему"""
+        if self._stock_refresh_task is None or self._stock_refresh_task.done():
+            self._stock_refresh_task = asyncio.create_task(self._refresh_stock())
+            self._stock_refresh_task.add_done_callback(self._on_stock_refresh_done)
+        return self._stock_refresh_task
+
+    def _on_stock_refresh_done(self, task: asyncio.Task):
+        """Логирование ошибки фонового обновления остатков"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"❌ Ошибка обновления остатков: {error}")
+
+    async def _refresh_stock(self):
+        """Быстрое обновление только остатков
+
+        Запрашивает остатки, изменившиеся с прошлой синхронизации, и
+        пересобирает только товары, у которых остаток действительно
+        изменился. Товары и модификации не загружаются. Если идет полная
+        или инкрементальная синхронизация, обновление пропускается - она
+        сама подтянет остатки.
+        """
+        if self._sync_lock.locked() or self._source is None or self._stock_mark is None:
+            return
+        
+        async with self._sync_lock:
+            started = time.time()
+            source = self._source
+            stock_mark = self._moscow_time(-self._stock_mark_overlap)
+            stock_changes = await self._get_stock_changes(self._stock_mark)
             
-            # Получаем модификации (variants) для каждого товара
-            variants_data = await self._get_variants()
-            print(f"🔄 Получено модификаций: {len(variants_data)}")
+            affected = self._apply_stock_changes(source, stock_changes)
+            self._stock_mark = stock_mark
+            self._stock_synced_at = time.time()
             
-            # Получаем остатки
-            stock_data = await self._get_stock_all()
-            print(f"📊 Получено остатков: {len(stock_data)}")
+            if affected:
+                # Копия при записи: текущий снимок не меняется, публикуется новый
+                self._publish_snapshot(CatalogSnapshot(self._rebuild_affected(source, affected)))
+                self._schedule_image_resolution()
+                print(f"📦 Остатки обновлены: изменений {len(stock_changes)}, товаров затронуто {len(affected)}")
             
-            # Объединяем данные
-            products = await self._merge_products_with_variants_and_stock(products_data, variants_data, stock_data)
-            print(f"✅ Обработано товаров: {len(products)}")
+            self.refresh_status.update(
+                last_stock_refresh=time.time(),
+                last_stock_duration=round(time.time() - started, 3),
+                products=len(self._snapshot),
+                version=self._snapshot.version
+            )
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> int:
+        """Прием вебхука МойСклад: ID изменившихся сущностей ставятся в очередь
+
+        Поддерживаются события товаров и модификаций (CREATE/UPDATE/DELETE),
+        документов, меняющих остатки, и вебхук на изменение остатков
+        (webhookstock). Обработка идет в фоне одной пачкой через
+        self._webhook_debounce секунд после первого события. Возвращает
+        количество принятых событий.
+        """
+        accepted = 0
+        if payload.get('reportUrl'):
+            # Вебхук на изменение остатков
+            self._webhook_stock = True
+            accepted += 1
+        
+        for event in payload.get('events') or []:
+            meta = event.get('meta') or {}
+            entity_type = meta.get('type')
+            entity_id = meta.get('href', '').split('/')[-1].split('?')[0]
+            if entity_type == 'product' and entity_id:
+                self._webhook_products.add(entity_id)
+            elif entity_type == 'variant' and entity_id:
+                self._webhook_variants.add(entity_id)
+            elif entity_type in STOCK_DOCUMENT_TYPES:
+                self._webhook_stock = True
+            else:
+                continue
+            accepted += 1
+        
+        if accepted and (self._webhook_task is None or self._webhook_task.done()):
+            self._webhook_task = asyncio.create_task(self._process_webhooks())
+        print(f"🪝 Вебхук МойСклад: принято событий {accepted}")
+        return accepted
+
+    async def _process_webhooks(self):
+        """Обработка очереди вебхуков пачками, пока она не опустеет"""
+        while self._webhook_products or self._webhook_variants or self._webhook_stock:
+            # Пауза собирает серию событий (например, массовое редактирование) в одну пачку
+            await asyncio.sleep(self._webhook_debounce)
+            product_ids, self._webhook_products = self._webhook_products, set()
+            variant_ids, self._webhook_variants = self._webhook_variants, set()
+            stock_changed, self._webhook_stock = self._webhook_stock, False
+            try:
+                if product_ids or variant_ids:
+                    await self._refresh_entities(product_ids, variant_ids)
+                    product_ids = variant_ids = ()
+                if stock_changed:
+                    if self._sync_lock.locked():
+                        # Идет синхронизация, и ее остатки могли быть получены до
+                        # события: обновление остатков повторяется после нее
+                        self._webhook_stock = True
+                    else:
+                        await self._refresh_stock()
+            except Exception as e:
+                print(f"❌ Ошибка обработки вебхуков: {e}")
+                if self._scheduler_task is not None:
+                    # Изменения не потеряются: их подхватит инкрементальная синхронизация
+                    self._refresh_requested.set()
+                    continue
+                # Без планировщика события возвращаются в очередь и повторяются позже
+                self._webhook_products.update(product_ids)
+                self._webhook_variants.update(variant_ids)
+                self._webhook_stock = self._webhook_stock or stock_changed
+                await asyncio.sleep(self._refresh_retry_interval)
+
+    async def _refresh_entities(self, product_ids: set, variant_ids: set):
+        """Загрузка указанных товаров и модификаций и пересборка только их товаров"""
+        if self._source is None:
+            # Каталог еще не загружен - первая полная синхронизация получит все сразу
+            return
+        
+        async with self._sync_lock:
+            started = time.time()
+            product_ids = list(product_ids)
+            variant_ids = list(variant_ids)
+            semaphore = asyncio.Semaphore(self._page_concurrency)
             
-            # Кэшируем результат
-            self._products_cache = products
-            self._cache_timestamp = time.time()
-            print(f"💾 Товары закэшированы ({len(products)} шт.)")
+            async def fetch(entity_type, entity_id):
+                async with semaphore:
+                    return await self._get_entity(entity_type, entity_id)
             
-            return self._get_cached_products(limit, offset)
+            rows = await asyncio.gather(
+                *(fetch('product', product_id) for product_id in product_ids),
+                *(fetch('variant', variant_id) for variant_id in variant_ids)
+            )
+            products_data = rows[:len(product_ids)]
+            variants_data = rows[len(product_ids):]
             
-        except Exception as e:
-            print(f"❌ Ошибка получения товаров: {e}")
-            import traceback
-            traceback.print_exc()
-            return self._get_test_products()
+            source = self._source
+            # Метку updated двигает только инкрементальная синхронизация,
+            # иначе она пропустит изменения, для которых вебхук не пришел
+            updated_mark = source.updated_mark
+            affected = set()
+            for product_id, product in zip(product_ids, products_data):
+                affected.add(product_id)
+                if product is None or product.get('archived'):
+                    source.remove_product(product_id)
+                else:
+                    source.put_product(product)
+            
+            for variant_id, variant in zip(variant_ids, variants_data):
+                affected.add(source.variant_parent.get(variant_id))
+                product_id = self._variant_product_id(variant) if variant is not None else None
+                if product_id is None or variant.get('archived'):
+                    source.remove_variant(variant_id)
+                else:
+                    affected.add(product_id)
+                    source.put_variant(variant, product_id)
+            source.updated_mark = updated_mark
+            
+            affected.discard(None)
+            if affected:
+                self._publish_snapshot(CatalogSnapshot(self._rebuild_affected(source, affected)))
+                self._schedule_image_resolution()
+            print(f"🪝 Обновлено по вебхукам: товаров {len(product_ids)}, модификаций {len(variant_ids)}, "
+                  f"пересобрано {len(affected)} за {time.time() - started:.2f}с")
+            
+            self.refresh_status.update(
+                last_webhook_refresh=time.time(),
+                products=len(self._snapshot),
+                version=self._snapshot.version
+            )
 
-    async def _get_products_info(self):
-        """Получение информации о родительских товарах"""
-        print("🛍️ Загружаем родительские товары...")
+    async def _get_entity(self, entity_type: str, entity_id: str) -> Optional[Dict]:
+        """Одна сущность МойСклад по ID (None, если она удалена)"""
+        url = f"{self.base_url}/entity/{entity_type}/{entity_id}"
+        try:
+            row = await self._get_json(url, {})
+        except MoySkladAPIError as e:
+            if e.status == 404:
+                return None
+            raise
+        return self._slim_variant(row) if entity_type == 'variant' else self._slim_product(row)
+
+    async def _build_catalog(self) -> List[Product]:
+        """Полная загрузка фидов МойСклад и сборка нового списка товаров"""
+        stock_mark = self._moscow_time(-self._stock_mark_overlap)
+        
+        # Строки раскладываются в исходные данные по мере прихода страниц,
+        # полные списки фидов в памяти не собираются
+        source = CatalogSource()
+        
+        async def load_products():
+            async for product in self._stream_products():
+                self._put_product_row(source, product)
+        
+        async def load_variants():
+            async for variant in self._stream_variants():
+                self._put_variant_row(source, variant)
+        
+        # Товары, модификации и остатки независимы - загружаем параллельно
+        feed_names = ('products', 'variants', 'stock')
+        results = await asyncio.gather(
+            load_products(),
+            load_variants(),
+            self._get_stock_all(),
+            return_exceptions=True
+        )
+        
+        # Падение одного фида не отменяет остальные: вместо него берутся данные
+        # прошлой полной загрузки. Без них частично загруженный каталог не
+        # публикуется, остается текущий снимок
+        previous = self._source
+        failed = []
+        for feed_name, result in zip(feed_names, results):
+            if isinstance(result, BaseException):
+                print(f"⚠️ Не удалось загрузить фид '{feed_name}': {result}")
+                if previous is None:
+                    raise result
+                print(f"↩️ Используем последние успешные данные фида '{feed_name}'")
+                failed.append(feed_name)
+        
+        if 'products' in failed:
+            source.products = dict(previous.products)
+        if 'variants' in failed:
+            source.variants = dict(previous.variants)
+            source.variant_parent = dict(previous.variant_parent)
+            source.variants_by_product = {
+                product_id: dict(variant_ids) for product_id, variant_ids in previous.variants_by_product.items()
+            }
+        source.stock = dict(previous.stock) if 'stock' in failed else results[2]
+        if failed:
+            # Изменения подставленного фида после прошлой метки заберет инкрементальная синхронизация
+            source.updated_mark = previous.updated_mark
+        
+        print(f"🛍️ Получено родительских товаров: {len(source.products)}")
+        print(f"🔄 Получено модификаций: {len(source.variants)}")
+        print(f"📊 Получено остатков: {len(source.stock)}")
+        
+        # Объединяем данные
+        products = self._merge_products_with_variants_and_stock(source)
+        print(f"✅ Обработано товаров: {len(products)}")
+        
+        self._source = source
+        if 'stock' not in failed:
+            self._stock_mark = stock_mark
+            self._stock_synced_at = time.time()
+        return products
+
+    async def _delta_catalog(self) -> Optional[List[Product]]:
+        """Инкрементальная синхронизация: только сущности с updated новее последней метки
+
+        Изменившиеся товары, модификации и остатки подставляются в исходные
+        данные, а заново собираются только затронутые товары. Возвращает
+        None, если в МойСклад ничего не изменилось.
+        """
+        source = self._source
+        # Метка с точностью до секунды и условие >= перекрывают границу окна
+        updated_since = source.updated_mark[:19]
+        stock_mark = self._moscow_time(-self._stock_mark_overlap)
+        
+        products_data, variants_data, stock_changes = await asyncio.gather(
+            self._get_products_info(updated_since=updated_since),
+            self._get_variants(updated_since=updated_since),
+            self._get_stock_changes(self._stock_mark)
+        )
+        print(f"🔁 Изменилось с {updated_since}: товаров {len(products_data)}, "
+              f"модификаций {len(variants_data)}, остатков {len(stock_changes)}")
+        
+        affected = set()
+        for product in products_data:
+            product_id = product.get('id')
+            if not product_id or self._is_same_version(source.products.get(product_id), product):
+                continue
+            affected.add(product_id)
+            if product.get('archived'):
+                source.remove_product(product_id)
+            else:
+                source.put_product(product)
+        
+        for variant in variants_data:
+            variant_id = variant.get('id')
+            product_id = self._variant_product_id(variant)
+            if not variant_id or not product_id or self._is_same_version(source.variants.get(variant_id), variant):
+                continue
+            affected.add(source.variant_parent.get(variant_id))
+            affected.add(product_id)
+            if variant.get('archived'):
+                source.remove_variant(variant_id)
+            else:
+                source.put_variant(variant, product_id)
+        
+        affected |= self._apply_stock_changes(source, stock_changes)
         
-        # Проверяем и обновляем токен при необходимости
-        self._refresh_token_if_needed()
+        self._stock_mark = stock_mark
+        self._stock_synced_at = time.time()
+        affected.discard(None)
+        if not affected:
+            return None
+        
+        return self._rebuild_affected(source, affected)
+
+    def _apply_stock_changes(self, source: CatalogSource, stock_changes: Dict[str, float]) -> set:
+        """Подстановка изменившихся остатков, возвращает ID затронутых товаров"""
+        affected = set()
+        for item_id, quantity in stock_changes.items():
+            if source.stock.get(item_id, 0) != max(quantity, 0):
+                affected.add(source.product_of(item_id))
+            source.set_stock(item_id, quantity)
+        affected.discard(None)
+        return affected
+
+    def _rebuild_affected(self, source: CatalogSource, affected: set) -> List[Product]:
+        """Новый список товаров: затронутые собираются заново, остальные берутся из текущего снимка"""
+        pending_images = {}
+        rebuilt = {}
+        for product_id in affected:
+            product = source.products.get(product_id)
+            if product is not None:
+                rebuilt[product_id] = self._build_product(product, source.variants_of(product_id), source.stock, pending_images)
+        
+        products = []
+        for product_id, product in source.products.items():
+            if product_id in rebuilt:
+                result_product = rebuilt[product_id]
+            else:
+                result_product = self._snapshot.by_id.get(product_id)
+                if result_product is None:
+                    result_product = self._build_product(product, source.variants_of(product_id), source.stock, pending_images)
+            if result_product is not None:
+                products.append(result_product)
+        
+        print(f"🔁 Пересобрано товаров: {len(rebuilt)} из {len(products)}")
+        self._pending_images.update(pending_images)
+        return products
+
+    def _is_same_version(self, known: Optional[Dict], row: Dict) -> bool:
+        """Строка уже загружена в этой версии (повтор из-за перекрытия окна >=)"""
+        return known is not None and not row.get('archived') and known.get('updated') == row.get('updated')
+
+    def _moscow_time(self, shift_seconds: float = 0) -> str:
+        """Текущее время по Москве в формате фильтров МойСклад"""
+        moment = datetime.now(MOSCOW_TZ) + timedelta(seconds=shift_seconds)
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+    @contextlib.asynccontextmanager
+    async def request(self, url: str, params: Optional[Dict[str, Any]] = None, priority: int = PRIORITY_NORMAL,
+                      count_failures: bool = True):
+        """GET-запрос к МойСклад через ограничитель частоты
+
+        Слот ограничителя держится, пока открыт ответ. На 429 запрос
+        повторяется после паузы из Retry-After (не больше
+        self._rate_limit_retries раз), последний ответ отдается как есть.
+        Пока предохранитель разомкнут, запрос сразу завершается
+        CircuitOpenError. Сетевые ошибки и 5xx засчитываются предохранителю,
+        только если count_failures: вызов с собственными повторами (_get_json)
+        засчитывает ошибку сам, когда повторы исчерпаны.
+        """
+        session = await self.get_session()
+        attempt = 0
+        while True:
+            self._circuit.before_call()
+            async with self._rate_limiter.slot(priority):
+                try:
+                    response = await session.get(url, headers=self.headers, params=params)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if count_failures:
+                        self._circuit.record_failure(f"{type(e).__name__}: {e}")
+                    raise
+                async with response:
+                    if response.status < 500:
+                        self._circuit.record_success()
+                    elif count_failures:
+                        self._circuit.record_failure(f"HTTP {response.status}")
+                    self._rate_limiter.update_from_headers(response.headers)
+                    if response.status != 429 or attempt >= self._rate_limit_retries:
+                        yield response
+                        return
+                    # Пауза ставится до освобождения слота, иначе ожидающие запросы
+                    # успели бы уйти в уже ограниченный аккаунт
+                    retry_after = self._rate_limiter.retry_after(response.headers)
+                    self._rate_limiter.pause(retry_after)
+            attempt += 1
+            self._rate_limiter.throttled += 1
+            print(f"🚦 МойСклад ограничил частоту запросов, повтор через {retry_after:.1f}с: {url}")
+
+    async def _get_json(self, url: str, params: Dict[str, Any]) -> Any:
+        """GET-запрос к API МойСклад с разбором JSON и повторами при сбоях
+
+        Сетевые ошибки и ответы 5xx повторяются с экспоненциальной паузой
+        (self._retry_base_delay * 2^попытка со случайным разбросом), не больше
+        self._max_retries раз. Предохранителю засчитывается только вызов,
+        исчерпавший повторы: короткий сбой гасится повторами и не размыкает
+        его. Разомкнутый предохранитель не повторяется.
+        """
+        for attempt in range(self._max_retries + 1):
+            try:
+                return await self._get_json_once(url, params)
+            except MoySkladAPIError as e:
+                if e.status not in RETRY_STATUSES or attempt == self._max_retries:
+                    if e.status >= 500:
+                        self._circuit.record_failure(f"HTTP {e.status}")
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self._max_retries:
+                    self._circuit.record_failure(f"{type(e).__name__}: {e}")
+                    raise
+                error = e
+            
+            delay = min(self._retry_max_delay, self._retry_base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+            print(f"🔁 Сбой запроса {url} ({str(error) or type(error).__name__}), повтор {attempt + 1}/{self._max_retries} через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+    async def _get_json_once(self, url: str, params: Dict[str, Any], _retry_auth: bool = True) -> Any:
+        """Одна попытка GET-запроса с повтором после обновления токена на 401"""
+        used_token = self.api_token
+        async with self.request(url, params, count_failures=False) as response:
+            print(f"📊 Статус ответа {url} (offset={params.get('offset', 0)}): {response.status}")
+
+            if response.status == 200:
+                # Разбор тела напрямую из байтов быстрым декодером
+                return json_codec.loads(await response.read())
+
+            error_text = await response.text()
+
+        if response.status == 401 and _retry_auth:
+            print("🔄 Токен истек во время запроса, обновляем...")
+            # Одновременные 401 ждут одного общего обновления токена
+            if await self._tokens.refresh(used_token):
+                # Повторяем запрос с новым токеном
+                return await self._get_json_once(url, params, _retry_auth=False)
+
+        raise MoySkladAPIError(response.status, error_text)
+
+    async def _paginate(self, url: str, params: Optional[Dict[str, Any]] = None, page_size: int = 1000):
+        """Асинхронная постраничная выборка строк списка МойСклад
+
+        Первая страница загружается сразу и дает общее количество строк
+        (meta.size), остальные страницы запрашиваются параллельно, не больше
+        self._page_concurrency одновременно. Строки отдаются в порядке
+        страниц: порядок товаров и модификаций одинаков от синхронизации к
+        синхронизации. Страница, загруженная раньше предыдущих, ждет своей
+        очереди, поэтому в памяти не больше self._page_concurrency страниц.
+        """
+        base_params = dict(params or {})
+        base_params['limit'] = page_size
+
+        first_page = await self._get_json(url, {**base_params, 'offset': 0})
+        total = first_page.get('meta', {}).get('size', 0)
+        rows = first_page.get('rows', [])
+        del first_page
+        for row in rows:
+            yield row
+        del rows
+
+        offsets = range(page_size, total, page_size)
+        if not offsets:
+            return
+
+        print(f"📑 {url}: всего строк {total}, догружаем страниц: {len(offsets)}")
+        offsets = iter(offsets)
+
+        def fetch(offset):
+            return asyncio.create_task(self._get_json(url, {**base_params, 'offset': offset}))
+
+        # Запросы страниц в порядке offset; следующая страница запрашивается,
+        # как только очередная отдана, чтобы параллельно их было не больше лимита
+        tasks = collections.deque(fetch(offset) for offset in itertools.islice(offsets, self._page_concurrency))
+        try:
+            while tasks:
+                page = await tasks[0]
+                tasks.popleft()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    tasks.append(fetch(next_offset))
+                rows = page.get('rows', [])
+                del page
+                for row in rows:
+                    yield row
+                del rows
+        finally:
+            # Отменяем оставшиеся запросы при ошибке или досрочном выходе
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_products(self, updated_since: Optional[str] = None):
+        """Родительские товары по мере загрузки страниц (при updated_since - только изменившиеся)
+
+        Из каждой строки сразу берутся только нужные поля, страница целиком не хранится.
+        """
+        print("🛍️ Загружаем родительские товары...")
         
         if not self.api_token:
             print("⚠️ API токен МойСклад отсутствует")
-            return []
+            return
 
+        count = 0
         try:
             url = f"{self.base_url}/entity/product"
-            params = {'limit': 2000}  # Увеличиваем лимит
-            
             print(f"📡 Запрос товаров к: {url}")
-            print(f"🔑 Headers: {self.headers}")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers, params=params) as response:
-                    print(f"📊 Статус ответа товаров: {response.status}")
+            async for product in self._paginate(url, self._updated_filter(updated_since)):
+                count += 1
+                yield self._slim_product(product)
 
-                    if response.status == 200:
-                        data = await response.json()
-                        print(f"📦 Получено товаров: {len(data.get('rows', []))}")
-                        
-                        if data.get('rows'):
-                            first_item = data['rows'][0]
-                            print(f"🔍 Первый товар: {first_item.get('name', 'Unknown')}")
-                        
-                        return data.get('rows', [])
-                    elif response.status == 401:
-                        print("🔄 Токен истек во время запроса, обновляем...")
-                        if self.refresh_token():
-                            # Повторяем запрос с новым токеном
-                            return await self._get_products_info()
-                        else:
-                            return []
-                    else:
-                        error_text = await response.text()
-                        print(f"❌ Ошибка API МойСклад при получении товаров: {response.status}")
-                        print(f"📄 Текст ошибки: {error_text}")
-                        return []
+            print(f"📦 Всего получено товаров: {count}")
 
         except Exception as e:
             print(f"💥 Исключение при получении товаров: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            raise
 
-    async def _get_variants(self):
-        """Получение модификаций (variants) с расширенной информацией"""
+    async def _stream_variants(self, updated_since: Optional[str] = None):
+        """Модификации по мере загрузки страниц (при updated_since - только изменившиеся)"""
         print("🔄 Загружаем модификации товаров...")
         
         if not self.api_token:
             print("⚠️ API токен МойСклад отсутствует")
-            return []
+            return
 
+        count = 0
         try:
             url = f"{self.base_url}/entity/variant"
-            params = {
-                'limit': 1000,  # Максимальный лимит за запрос
-                'expand': 'product'  # Получаем информацию о родительском товаре
-            }
+            # Без expand=product: ID родительского товара есть в ссылке product.meta.href
+            params = self._updated_filter(updated_since)
             
             print(f"📡 Запрос модификаций к: {url}")
-            print(f"🔑 Headers: {self.headers}")
 
-            all_variants = []
-            offset = 0
-            
-            async with aiohttp.ClientSession() as session:
-                while True:
-                    params['offset'] = offset
-                    
-                    async with session.get(url, headers=self.headers, params=params) as response:
-                        print(f"📊 Статус ответа модификаций (offset={offset}): {response.status}")
+            async for variant in self._paginate(url, params):
+                count += 1
+                yield self._slim_variant(variant)
 
-                        if response.status == 200:
-                            data = await response.json()
-                            variants = data.get('rows', [])
-                            
-                            if not variants:
-                                break
-                            
-                            all_variants.extend(variants)
-                            print(f"📦 Получено модификаций в этом запросе: {len(variants)}")
-                            
-                            if len(variants) < 1000:
-                                break
-                            
-                            offset += 1000
-                        else:
-                            error_text = await response.text()
-                            print(f"❌ Ошибка API МойСклад при получении модификаций: {response.status}")
-                            print(f"📄 Текст ошибки: {error_text}")
-                            break
-
-            print(f"📦 Всего получено модификаций: {len(all_variants)}")
-            
-            if all_variants:
-                first_item = all_variants[0]
-                print(f"🔍 Первая модификация: {first_item.get('name', 'Unknown')}")
-            
-            return all_variants
+            print(f"📦 Всего получено модификаций: {count}")
 
         except Exception as e:
             print(f"💥 Исключение при получении модификаций: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            raise
+
+    async def _get_products_info(self, updated_since: Optional[str] = None) -> List[Dict]:
+        """Список родительских товаров (для инкрементальной синхронизации)"""
+        return [product async for product in self._stream_products(updated_since)]
+
+    async def _get_variants(self, updated_since: Optional[str] = None) -> List[Dict]:
+        """Список модификаций (для инкрементальной синхронизации)"""
+        return [variant async for variant in self._stream_variants(updated_since)]
+
+    async def _get_stock_all(self) -> Dict[str, float]:
+        """Положительные остатки по ID товара или модификации из краткого отчета /report/stock/all/current
 
-    async def _get_stock_all(self):
-        """Получение остатков товаров из /report/stock/all"""
+        Краткий отчет отдает только ID и количество, без карточек товаров,
+        и приходит одним ответом без пагинации.
+        """
         print("📊 Загружаем остатки товаров...")
         
         if not self.api_token:
             print("⚠️ API токен МойСклад отсутствует")
-            return []
+            return {}
+
+        try:
+            url = f"{self.base_url}/report/stock/all/current"
+            print(f"📡 Запрос остатков к: {url}")
+
+            # quantity - то же поле "Доступно", что и в /report/stock/all
+            rows = await self._get_json(url, {'stockType': 'quantity'})
+            stock_dict = {}
+            for row in rows:
+                quantity = row.get('quantity', 0)
+                if row.get('assortmentId') and quantity > 0:
+                    stock_dict[row['assortmentId']] = quantity
+
+            print(f"📦 Всего получено остатков: {len(stock_dict)}")
+            print(f"📊 Общий положительный stock: {sum(stock_dict.values())}")
+            return stock_dict
+
+        except Exception as e:
+            print(f"💥 Исключение при получении остатков: {e}")
+            raise
+
+    def _updated_filter(self, updated_since: Optional[str]) -> Dict[str, str]:
+        """Параметр filter для выборки изменившихся сущностей (включая архивные)"""
+        if not updated_since:
+            return {}
+        # Архивные тоже нужны: так узнаем, что товар пора убрать из каталога
+        return {'filter': f"updated>={updated_since};archived=true;archived=false"}
+
+    async def _get_stock_changes(self, changed_since: str) -> Dict[str, float]:
+        """Остатки, изменившиеся с changed_since, из краткого отчета /report/stock/all/current"""
+        print(f"📊 Загружаем изменения остатков с {changed_since}...")
+        
+        if not self.api_token:
+            print("⚠️ API токен МойСклад отсутствует")
+            return {}
 
         try:
-            url = f"{self.base_url}/report/stock/all"
+            url = f"{self.base_url}/report/stock/all/current"
             params = {
-                'limit': 1000,  # Максимальный лимит за запрос
+                'changedSince': changed_since,
+                'stockType': 'quantity',  # То же поле, что quantity в /report/stock/all
+                'include': 'zeroLines'  # Обнулившиеся остатки тоже нужны
             }
-            
-            print(f"📡 Запрос остатков к: {url}")
-            print(f"🔑 Headers: {self.headers}")
+            rows = await self._get_json(url, params)
+            return {row['assortmentId']: row.get('quantity', 0) for row in rows if row.get('assortmentId')}
 
-            all_stock = []
-            offset = 0
-            
-            async with aiohttp.ClientSession() as session:
-                while True:
-                    params['offset'] = offset
-                    
-                    async with session.get(url, headers=self.headers, params=params) as response:
-                        print(f"📊 Статус ответа остатков (offset={offset}): {response.status}")
+        except Exception as e:
+            print(f"💥 Исключение при получении изменений остатков: {e}")
+            raise
 
-                        if response.status == 200:
-                            data = await response.json()
-                            stock_items = data.get('rows', [])
-                            
-                            if not stock_items:
-                                break
-                            
-                            all_stock.extend(stock_items)
-                            print(f"📦 Получено остатков в этом запросе: {len(stock_items)}")
-                            
-                            if len(stock_items) < 1000:
-                                break
-                            
-                            offset += 1000
-                        else:
-                            error_text = await response.text()
-                            print(f"❌ Ошибка API МойСклад при получении остатков: {response.status}")
-                            print(f"📄 Текст ошибки: {error_text}")
-                            break
+    def _variant_product_id(self, variant: dict) -> Optional[str]:
+        """ID родительского товара модификации"""
+        product = variant.get('product')
+        if not isinstance(product, dict):
+            return None
+        if product.get('id'):
+            # Если product уже развернут (expand) или строка сокращена до ID
+            return product['id']
+        meta_href = product.get('meta', {}).get('href')
+        if meta_href:
+            # Если product содержит только meta
+            return meta_href.split('/')[-1].split('?')[0]
+        return None
 
-            print(f"📦 Всего получено остатков: {len(all_stock)}")
-            
-            if all_stock:
-                first_item = all_stock[0]
-                print(f"🔍 Первый остаток: {first_item.get('name', 'Unknown')}")
-            
-            return all_stock
+    def _slim_product(self, product: dict) -> dict:
+        """Строка товара только с полями, которые использует сборка каталога"""
+        slim = {
+            'id': product.get('id'),
+            'name': product.get('name', ''),
+            'description': product.get('description', ''),
+            'article': product.get('article', ''),
+            'updated': product.get('updated'),
+            'archived': product.get('archived', False)
+        }
+        if product.get('pathName'):
+            slim['pathName'] = product['pathName']
+        folder_name = (product.get('productFolder') or {}).get('name')
+        if folder_name:
+            slim['productFolder'] = {'name': folder_name}
+        if product.get('salePrices'):
+            slim['salePrices'] = [{'value': product['salePrices'][0].get('value', 0)}]
+        images_meta = (product.get('images') or {}).get('meta')
+        if images_meta:
+            slim['images'] = {'meta': {'href': images_meta.get('href'), 'size': images_meta.get('size', 0)}}
+        return slim
+
+    def _slim_variant(self, variant: dict) -> dict:
+        """Строка модификации только с нужными полями (родительский товар - только ID)"""
+        slim = {
+            'id': variant.get('id'),
+            'name': variant.get('name', ''),
+            'updated': variant.get('updated'),
+            'archived': variant.get('archived', False),
+            'characteristics': [
+                {'name': char.get('name', ''), 'value': char.get('value', '')}
+                for char in variant.get('characteristics') or []
+            ]
+        }
+        product_id = self._variant_product_id(variant)
+        if product_id:
+            slim['product'] = {'id': product_id}
+        if variant.get('salePrices'):
+            slim['salePrices'] = [{'value': variant['salePrices'][0].get('value', 0)}]
+        return slim
+
+    def _put_product_row(self, source: CatalogSource, product: dict):
+        """Добавление строки товара в исходные данные каталога"""
+        if product.get('id'):
+            source.put_product(product)
 
+    def _put_variant_row(self, source: CatalogSource, variant: dict):
+        """Добавление строки модификации с привязкой к родительскому товару"""
+        try:
+            product_id = self._variant_product_id(variant)
+            if product_id and variant.get('id'):
+                source.put_variant(variant, product_id)
         except Exception as e:
-            print(f"💥 Исключение при получении остатков: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            print(f"⚠️ Ошибка группировки модификации: {e}")
 
-    async def _merge_products_with_variants_and_stock(self, products_data, variants_data, stock_data):
+    def _merge_products_with_variants_and_stock(self, source: CatalogSource) -> List[Product]:
         """Объединение данных о товарах с модификациями и остатками"""
         print("🔗 Объединяем данные о товарах с модификациями и остатками...")
-        
-        # Создаем словарь остатков по ID (только положительные значения)
-        stock_dict = {}
-        total_positive_stock = 0
-        
-        for stock_item in stock_data:
-            try:
-                # В /report/stock/all используется поле 'meta' с href
-                meta_href = stock_item.get('meta', {}).get('href', '')
-                if meta_href:
-                    item_id = meta_href.split('/')[-1].split('?')[0]
-                    
-                    # В /report/stock/all используется поле 'quantity'
-                    quantity = stock_item.get('quantity', 0)
-                    
-                    # Берем только положительные значения
-                    if quantity > 0:
-                        stock_dict[item_id] = quantity
-                        total_positive_stock += quantity
-            except Exception as e:
-                print(f"⚠️ Ошибка обработки остатка: {e}")
-                continue
-        
-        print(f"📋 Создан словарь остатков: {len(stock_dict)} позиций")
-        print(f"📊 Общий положительный stock: {total_positive_stock}")
-        
-        # Группируем модификации по родительским товарам
-        variants_by_product = {}
-        for variant in variants_data:
-            try:
-                # Извлекаем ID родительского товара из meta.href
-                product_id = None
-                if variant.get('product'):
-                    if isinstance(variant['product'], dict) and variant['product'].get('id'):
-                        # Если product уже развернут (с expand)
-                        product_id = variant['product']['id']
-                    elif isinstance(variant['product'], dict) and variant['product'].get('meta', {}).get('href'):
-                        # Если product содержит только meta
-                        meta_href = variant['product']['meta']['href']
-                        product_id = meta_href.split('/')[-1].split('?')[0]
-                
-                if product_id:
-                    if product_id not in variants_by_product:
-                        variants_by_product[product_id] = []
-                    variants_by_product[product_id].append(variant)
-            except Exception as e:
-                print(f"⚠️ Ошибка группировки модификации: {e}")
-                continue
-        
-        print(f"📋 Сгруппировано модификаций по товарам: {len(variants_by_product)}")
+        print(f"📋 Сгруппировано модификаций по товарам: {len(source.variants_by_product)}")
         
         # Создаем итоговый список товаров
         result_products = []
+        pending_images = {}
         
         # Обрабатываем все родительские товары
-        for product in products_data:
-            try:
-                product_id = product.get('id')
-                if not product_id:
-                    continue
-                
-                # Получаем модификации для этого товара
-                variants = variants_by_product.get(product_id, [])
-                
-                # Определяем категорию на основе pathName
-                category = 'other'
-                if product.get('pathName'):
-                    category = product['pathName']
-                elif product.get('productFolder') and product['productFolder'].get('name'):
-                    category = product['productFolder']['name']
-                
-                # Извлекаем доступные размеры и цвета из модификаций (показываем только варианты с остатками > 0)
-                available_sizes = []
-                available_colors = []
-                total_stock = 0
-                
-                # Если у товара есть варианты, считаем stock по вариантам
-                if variants:
-                    for variant in variants:
-                        variant_id = variant.get('id')
-                        variant_stock = stock_dict.get(variant_id, 0)
-                        total_stock += variant_stock
-                        
-                        # Извлекаем характеристики только для вариантов с остатками > 0
-                        if variant_stock > 0 and variant.get('characteristics'):
-                            for char in variant['characteristics']:
-                                char_name = char.get('name', '').lower()
-                                char_value = char.get('value', '')
-                                
-                                if 'размер' in char_name or 'size' in char_name:
-                                    if self._is_valid_size(char_value) and char_value not in available_sizes:
-                                        available_sizes.append(char_value)
-                                elif 'цвет' in char_name or 'color' in char_name:
-                                    if self._is_valid_color(char_value) and char_value not in available_colors:
-                                        available_colors.append(char_value)
-                    
-                    # Если нет характеристик, извлекаем из названий модификаций (только с остатками > 0)
-                    if not available_sizes and not available_colors:
-                        for variant in variants:
-                            variant_id = variant.get('id')
-                            variant_stock = stock_dict.get(variant_id, 0)
-                            
-                            if variant_stock > 0:
-                                name_modifications = self._extract_modifications(variant.get('name', ''))
-                                if name_modifications.get('size') and name_modifications['size'] not in available_sizes:
-                                    available_sizes.append(name_modifications['size'])
-                                if name_modifications.get('color') and name_modifications['color'] not in available_colors:
-                                    available_colors.append(name_modifications['color'])
-                else:
-                    # Если у товара нет вариантов, берем stock самого товара
-                    total_stock = stock_dict.get(product_id, 0)
-                
-                # Получаем цену из первой модификации или из товара
-                price = 0
-                if variants and variants[0].get('salePrices') and variants[0]['salePrices']:
-                    price = variants[0]['salePrices'][0].get('value', 0) / 100
-                elif product.get('salePrices') and product['salePrices']:
-                    price = product['salePrices'][0].get('value', 0) / 100
-                
-                # Очищаем название товара от скобок
-                clean_name_modifications = self._extract_modifications(product.get('name', ''))
-                clean_name = clean_name_modifications.get('clean_name', product.get('name', ''))
-                
-                # Создаем товар
-                result_product = {
-                    'id': product.get('name', ''),
-                    'original_id': product_id,
-                    'name': clean_name,  # Используем очищенное название
-                    'description': product.get('description', ''),
-                    'article': product.get('article', ''),
-                    'price': int(price),
-                    'image': None,
-                    'stock': int(total_stock),
-                    'category': category,
-                    'modifications_text': f"В наличии: {int(total_stock)}",
-                    'available_colors': available_colors,
-                    'available_sizes': available_sizes,
-                    'variants': []  # Добавляем список модификаций
-                }
-                
-                # Добавляем модификации в товар (показываем только варианты с остатками > 0)
-                for variant in variants:
-                    variant_id = variant.get('id')
-                    variant_stock = stock_dict.get(variant_id, 0)
-                    
-                    # Пропускаем варианты с остатками 0
-                    if variant_stock <= 0:
-                        continue
-                    
-                    variant_data = {
-                        'id': variant_id,
-                        'name': variant.get('name', ''),
-                        'stock': int(variant_stock),
-                        'price': int(price),  # Используем цену товара
-                        'sizes': [],
-                        'colors': []
-                    }
-                    
-                    # Извлекаем характеристики модификации
-                    if variant.get('characteristics'):
-                        for char in variant['characteristics']:
-                            char_name = char.get('name', '').lower()
-                            char_value = char.get('value', '')
-                            
-                            if 'размер' in char_name or 'size' in char_name:
-                                if self._is_valid_size(char_value):
-                                    variant_data['sizes'].append(char_value)
-                            elif 'цвет' in char_name or 'color' in char_name:
-                                if self._is_valid_color(char_value):
-                                    variant_data['colors'].append(char_value)
-                    
-                    # Если нет характеристик, извлекаем из названия
-                    if not variant_data['sizes'] and not variant_data['colors']:
-                        name_modifications = self._extract_modifications(variant.get('name', ''))
-                        if name_modifications.get('size'):
-                            variant_data['sizes'].append(name_modifications['size'])
-                        if name_modifications.get('color'):
-                            variant_data['colors'].append(name_modifications['color'])
-                    
-                    result_product['variants'].append(variant_data)
-                
-                # Определяем, нужно ли отправлять в "Брак"
-                if not available_sizes and not available_colors:
-                    result_product['category'] = 'Брак'
-                
-                # Добавляем изображение, если есть
-                if self._has_images(product):
-                    image_url = await self._get_product_images(product)
-                    result_product['image'] = image_url
-                else:
-                    result_product['image'] = None
-                
+        for product in source.products.values():
+            result_product = self._build_product(product, source.variants_of(product['id']), source.stock, pending_images)
+            if result_product is not None:
                 result_products.append(result_product)
-
-            except Exception as e:
-                print(f"⚠️ Ошибка обработки товара: {e}")
-                continue
         
         print(f"✅ Обработано товаров: {len(result_products)}")
+        print(f"🖼️ Изображений к загрузке в фоне: {len(pending_images)}")
+        self._pending_images = pending_images
         
         # Проверяем итоговый stock
-        total_result_stock = sum(product.get('stock', 0) for product in result_products)
+        total_positive_stock = sum(source.stock.values())
+        total_result_stock = sum(product.stock for product in result_products)
         print(f"📊 Итоговый stock всех товаров: {total_result_stock}")
         print(f"📊 Ожидаемый stock: {total_positive_stock}")
         print(f"📊 Разница: {total_positive_stock - total_result_stock}")
         
         return result_products
 
+    def _variant_attributes(self, variant: dict) -> Dict[str, Any]:
+        """Размеры и цвета модификации из характеристик и из названия
+
+        Результат кэшируется до изменения поля updated модификации, поэтому
+        пересборка товара при обновлении остатков не разбирает названия заново.
+        """
+        variant_id = variant.get('id')
+        cached = self._variant_attributes_cache.get(variant_id)
+        if cached is not None and cached[0] == variant.get('updated'):
+            return cached[1]
+        
+        sizes = []
+        colors = []
+        for char in variant.get('characteristics') or []:
+            char_name = char.get('name', '').lower()
+            char_value = char.get('value', '')
+            
+            if 'размер' in char_name or 'size' in char_name:
+                if self._is_valid_size(char_value):
+                    sizes.append((char_value, normalize_size(char_value)))
+            elif 'цвет' in char_name or 'color' in char_name:
+                if self._is_valid_color(char_value):
+                    colors.append((char_value, color_synonym_key(char_value)))
+        
+        name_modifications = self._attributes.extract(variant.get('name', ''))
+        if not sizes and not colors:
+            # Без характеристик размер и цвет берутся из названия модификации
+            if name_modifications['size']:
+                sizes.append((name_modifications['size'], name_modifications['size_key']))
+            if name_modifications['color']:
+                colors.append((name_modifications['color'], name_modifications['color_key']))
+        # Пары (значение, нормализованный ключ): синонимы (bordo/бордовый) дают один ключ
+        attributes = {
+            'sizes': tuple(sizes),
+            'colors': tuple(colors)
+        }
+        self._variant_attributes_cache[variant_id] = (variant.get('updated'), attributes)
+        return attributes
+
+    def _build_product(self, product: dict, variants: List[Dict], stock_dict: Dict[str, float],
+                       pending_images: Dict[str, Dict]) -> Optional[Product]:
+        """Сборка одного товара каталога из строки товара, его модификаций и остатков"""
+        try:
+            product_id = product.get('id')
+            if not product_id:
+                return None
+            
+            # Определяем категорию на основе pathName
+            category = 'other'
+            if product.get('pathName'):
+                category = product['pathName']
+            elif product.get('productFolder') and product['productFolder'].get('name'):
+                category = product['productFolder']['name']
+            
+            # Доступные размеры и цвета из модификаций с остатками > 0. Синонимы
+            # схлопываются в одно значение - первое встреченное написание
+            size_labels = {}
+            color_labels = {}
+            total_stock = 0
+            
+            # Если у товара есть варианты, считаем stock по вариантам
+            if variants:
+                for variant in variants:
+                    variant_id = variant.get('id')
+                    variant_stock = stock_dict.get(variant_id, 0)
+                    total_stock += variant_stock
+                
+                    if variant_stock > 0:
+                        attributes = self._variant_attributes(variant)
+                        for value, key in attributes['sizes']:
+                            size_labels.setdefault(key, value)
+                        for value, key in attributes['colors']:
+                            color_labels.setdefault(key, value)
+            else:
+                # Если у товара нет вариантов, берем stock самого товара
+                total_stock = stock_dict.get(product_id, 0)
+            
+            # Получаем цену из первой модификации или из товара
+            price = 0
+            if variants and variants[0].get('salePrices') and variants[0]['salePrices']:
+                price = variants[0]['salePrices'][0].get('value', 0) / 100
+            elif product.get('salePrices') and product['salePrices']:
+                price = product['salePrices'][0].get('value', 0) / 100
+            
+            # Очищаем название товара от скобок
+            clean_name = self._attributes.extract(product.get('name', ''))['clean_name']
+            
+            # Добавляем модификации в товар (показываем только варианты с остатками > 0)
+            result_variants = []
+            for variant in variants:
+                variant_id = variant.get('id')
+                variant_stock = stock_dict.get(variant_id, 0)
+            
+                # Пропускаем варианты с остатками 0
+                if variant_stock <= 0:
+                    continue
+            
+                # Размеры и цвета модификации - в написании товара, чтобы матрица
+                # остатков находила модификацию по значению из available_sizes/colors
+                attributes = self._variant_attributes(variant)
+                sizes = dict.fromkeys(size_labels.get(key, value) for value, key in attributes['sizes'])
+                colors = dict.fromkeys(color_labels.get(key, value) for value, key in attributes['colors'])
+            
+                # Цена модификации в ответе API - цена товара
+                result_variants.append(Variant.create(variant_id, variant.get('name', ''), int(variant_stock), sizes, colors))
+            
+            # Определяем, нужно ли отправлять в "Брак"
+            if not size_labels and not color_labels:
+                category = 'Брак'
+            
+            # Изображение берем из кэша, недостающие загрузятся в фоне после публикации
+            image = None
+            if self._has_images(product):
+                image = self._get_cached_image_url(product)
+                if not self._is_image_cache_valid(self._image_cache_key(product)):
+                    pending_images[product_id] = {
+                        'id': product_id,
+                        'name': product.get('name', ''),
+                        'images': product['images']
+                    }
+            
+            return Product.create(
+                id=product.get('name', ''),
+                original_id=product_id,
+                name=clean_name,  # Используем очищенное название
+                description=product.get('description', ''),
+                article=product.get('article', ''),
+                price=int(price),
+                stock=int(total_stock),
+                category=category,
+                available_colors=list(color_labels.values()),
+                available_sizes=list(size_labels.values()),
+                variants=result_variants,
+                image=image,
+                updated=product.get('updated')
+            )
+
+        except Exception as e:
+            print(f"⚠️ Ошибка обработки товара: {e}")
+            return None
+
     def _has_images(self, product: dict) -> bool:
         """Проверка наличия изображений у товара"""
         if not product.get('images'):
@@ -507,7 +1435,47 @@ class MoySkladAPI:
         meta = images.get('meta', {})
         return meta.get('size', 0) > 0
 
-    async def _get_product_images(self, product: dict) -> str:
+    def _image_cache_key(self, product: dict) -> str:
+        """Ключ кэша изображений товара"""
+        return f"{product.get('id', 'unknown')}_{product['images']['meta']['href']}"
+
+    def _get_cached_image_url(self, product: dict) -> Optional[str]:
+        """URL изображения из кэша (в том числе устаревший) без обращения к API"""
+        cache_entry = self._images_cache.get(self._image_cache_key(product))
+        return cache_entry['proxy_url'] if cache_entry else None
+
+    def _schedule_image_resolution(self):
+        """Запуск фоновой загрузки изображений для товаров из очереди"""
+        for product_id in list(self._pending_images):
+            task = asyncio.create_task(self._resolve_product_image(product_id))
+            self._image_tasks.add(task)
+            task.add_done_callback(self._image_tasks.discard)
+
+    async def _resolve_product_image(self, product_id: str, wait_in_queue: bool = True) -> Optional[str]:
+        """Загрузка изображения одного товара и подстановка его в опубликованный каталог"""
+        # Вне очереди (страница товара) не ждем фоновый семафор
+        queue_slot = self._image_semaphore if wait_in_queue else contextlib.nullcontext()
+        async with queue_slot:
+            product = self._pending_images.pop(product_id, None)
+            if product is None:
+                return None
+            # Пользователь ждет страницу товара - запрос вне очереди идет с обычным приоритетом
+            image_url = await self._get_product_images(product, PRIORITY_LOW if wait_in_queue else PRIORITY_NORMAL)
+
+        if image_url and self._snapshot.set_image(product_id, image_url) is not None:
+            self._schedule_snapshot_save()
+        return image_url
+
+    async def ensure_product_image(self, product: dict) -> Optional[str]:
+        """Загрузка изображения конкретного товара вне очереди (для страницы товара)"""
+        product_id = product.get('original_id')
+        if product_id in self._pending_images:
+            image_url = await self._resolve_product_image(product_id, wait_in_queue=False)
+            if image_url:
+                product['image'] = image_url
+        return product.get('image')
+
+    async def _get_product_images(self, product: dict, priority: int = PRIORITY_LOW) -> str:
         """Получение изображений товара по отдельному API endpoint с кэшированием"""
         if not self._has_images(product):
             return None
@@ -517,7 +1485,7 @@ class MoySkladAPI:
             product_name = product.get('name', 'Unknown')
             
             # Проверяем кэш изображений
-            cache_key = f"{product.get('id', 'unknown')}_{images_href}"
+            cache_key = self._image_cache_key(product)
             if self._is_image_cache_valid(cache_key):
                 cached_url = self._images_cache[cache_key]['proxy_url']
                 print(f"⚡ Используем кэш изображения для товара: {product_name}")
@@ -525,28 +1493,28 @@ class MoySkladAPI:
             
             print(f"🖼️ Загружаем изображения для товара: {product_name}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(images_href, headers=self.headers) as response:
-                    if response.status == 200:
-                        images_data = await response.json()
+            # Фоновые запросы изображений пропускают вперед фиды каталога и остатков
+            async with self.request(images_href, priority=priority) as response:
+                if response.status == 200:
+                    images_data = json_codec.loads(await response.read())
                         
-                        if images_data.get('rows'):
-                            first_image = images_data['rows'][0]
-                            download_href = first_image.get('meta', {}).get('downloadHref')
+                    if images_data.get('rows'):
+                        first_image = images_data['rows'][0]
+                        download_href = first_image.get('meta', {}).get('downloadHref')
                             
-                            if download_href:
-                                image_id = download_href.split('/')[-1]
-                                proxy_url = f"/proxy/image/{image_id}"
+                        if download_href:
+                            image_id = download_href.split('/')[-1]
+                            proxy_url = f"/proxy/image/{image_id}"
                                 
-                                # Кэшируем результат
-                                self._images_cache[cache_key] = {
-                                    'proxy_url': proxy_url,
-                                    'timestamp': time.time(),
-                                    'image_id': image_id
-                                }
+                            # Кэшируем результат
+                            self._images_cache[cache_key] = {
+                                'proxy_url': proxy_url,
+                                'timestamp': time.time(),
+                                'image_id': image_id
+                            }
                                 
-                                print(f"✅ Изображение найдено и закэшировано: {proxy_url}")
-                                return proxy_url
+                            print(f"✅ Изображение найдено и закэшировано: {proxy_url}")
+                            return proxy_url
             
             print(f"⚠️ Не удалось получить изображения для товара")
             return None
@@ -601,121 +1569,15 @@ class MoySkladAPI:
 
     def _extract_modifications(self, name):
         """Извлечение модификаций (размер и цвет) из названия товара"""
-        modifications = {'size': None, 'color': None, 'clean_name': name}
-        
-        # Ищем размеры в скобках или после запятой (все найденные в МойСклад)
-        size_patterns = [
-            r'\((\d{2,3})\)',  # (42), (44), (46)
-            r',\s*(\d{2,3})\s*\)',  # , 42), , 44)
-            r'размер\s*(\d{2,3})',  # размер 42
-            r'(\d{2,3})\s*размер',  # 42 размер
-            r'\b(\d{2,3})\b',  # просто число 42, 44, 46
-            r'\b(XS|S|M|L|XL|XXL)\b',  # буквенные размеры
-            r'\b(One\s*Size|OS|one\s*size|os)\b',  # One Size
-            r'\b(One\s*size|one\s*size)\b'  # Дополнительные варианты One size
-        ]
-        
-        # Ищем цвета (все найденные в МойСклад)
-        color_patterns = [
-            # Русские цвета в скобках
-            r'\(([^)]*?(?:белый|черный|красный|синий|зеленый|желтый|розовый|оранжевый|фиолетовый|коричневый|серый|голубой|бежевый|бордовый|хаки|шоколад|крем|молочный|ваниль|алый|лиловый|салатовый|бронзовый|светло-серый|темно-серый)[^)]*?)\)',
-            # Русские цвета после запятой
-            r',\s*([^)]*?(?:белый|черный|красный|синий|зеленый|желтый|розовый|оранжевый|фиолетовый|коричневый|серый|голубой|бежевый|бордовый|хаки|шоколад|крем|молочный|ваниль|алый|лиловый|салатовый|бронзовый|светло-серый|темно-серый)[^)]*?)\s*\)',
-            # Русские цвета как отдельные слова
-            r'\b(белый|черный|красный|синий|зеленый|желтый|розовый|оранжевый|фиолетовый|коричневый|серый|голубой|бежевый|бордовый|хаки|шоколад|крем|молочный|ваниль|алый|лиловый|салатовый|бронзовый|светло-серый|темно-серый)\b',
-            # Английские цвета как отдельные слова
-            r'\b(White|Black|Red|Blue|Green|Yellow|Pink|Orange|Purple|Brown|Grey|Gray|Cream|Beige|Burgundy|Khaki|Chocolate|Milk|Vanilla|Scarlet|Lilac|Lime|Bronze|Bordo|Light-Beige|Dark-Green|Dark-Denim)\b'
-        ]
-        
-        import re
-        
-        # Ищем размер
-        for pattern in size_patterns:
-            match = re.search(pattern, name, re.IGNORECASE)
-            if match:
-                size = match.group(1).strip()
-                # Валидация размера
-                if self._is_valid_size(size):
-                    modifications['size'] = size
-                    break
-        
-        # Ищем цвет
-        for pattern in color_patterns:
-            match = re.search(pattern, name, re.IGNORECASE)
-            if match:
-                color = match.group(1).strip()
-                # Валидация цвета
-                if self._is_valid_color(color):
-                    modifications['color'] = color
-                    break
-        
-        # Очищаем название от скобок с размерами и цветами
-        clean_name = name
-        # Убираем скобки с размерами
-        clean_name = re.sub(r'\(\s*\d{2,3}\s*\)', '', clean_name)
-        clean_name = re.sub(r'\(\s*(XS|S|M|L|XL|XXL)\s*\)', '', clean_name, flags=re.IGNORECASE)
-        clean_name = re.sub(r'\(\s*(One\s*Size|OS)\s*\)', '', clean_name, flags=re.IGNORECASE)
-        
-        # Убираем скобки с цветами (все найденные в МойСклад)
-        color_patterns_clean = [
-            r'\(\s*[^)]*?(?:белый|черный|красный|синий|зеленый|желтый|розовый|оранжевый|фиолетовый|коричневый|серый|голубой|бежевый|бордовый|хаки|шоколад|крем|молочный|ваниль|алый|лиловый|салатовый|бронзовый|светло-серый|темно-серый)[^)]*?\s*\)',
-            r'\(\s*[^)]*?(?:White|Black|Red|Blue|Green|Yellow|Pink|Orange|Purple|Brown|Grey|Gray|Cream|Beige|Burgundy|Khaki|Chocolate|Milk|Vanilla|Scarlet|Lilac|Lime|Bronze|Bordo|Light-Beige|Dark-Green|Dark-Denim)[^)]*?\s*\)'
-        ]
-        
-        for pattern in color_patterns_clean:
-            clean_name = re.sub(pattern, '', clean_name, flags=re.IGNORECASE)
-        
-        # Убираем запятые и лишние пробелы
-        clean_name = re.sub(r'\s*,\s*', ' ', clean_name)
-        clean_name = re.sub(r'\s+', ' ', clean_name)
-        clean_name = clean_name.strip()
-        
-        modifications['clean_name'] = clean_name
-        return modifications
+        return dict(self._attributes.extract(name))
 
     def _is_valid_size(self, size):
         """Проверка валидности размера"""
-        if not size:
-            return False
-        
-        size_lower = size.lower()
-        
-        # Валидные размеры (все найденные в МойСклад)
-        valid_sizes = [
-            # Буквенные размеры
-            'xs', 's', 'm', 'l', 'xl', 'xxl', 'xxxl',
-            # Универсальные размеры
-            'one size', 'os', 'one size', 'one size',
-            # Числовые размеры (женские)
-            '28', '29', '30', '31', '32', '33', '34', '35', '36', '37', '38', '39',
-            '40', '41', '42', '43', '44', '45', '46', '47', '48', '49', '50', '51', '52'
-        ]
-        
-        return size_lower in valid_sizes
+        return self._attributes.is_valid_size(size)
 
     def _is_valid_color(self, color):
         """Проверка валидности цвета"""
-        if not color:
-            return False
-        
-        color_lower = color.lower()
-        
-        # Валидные цвета (все найденные в МойСклад)
-        valid_colors = [
-            # Русские цвета
-            'белый', 'черный', 'красный', 'синий', 'зеленый', 'желтый', 'розовый', 
-            'оранжевый', 'фиолетовый', 'коричневый', 'серый', 'голубой', 'бежевый', 
-            'бордовый', 'хаки', 'шоколад', 'крем', 'молочный', 'ваниль', 'алый', 
-            'лиловый', 'салатовый', 'бронзовый', 'светло-серый', 'темно-серый',
-            # Английские цвета
-            'white', 'black', 'red', 'blue', 'green', 'yellow', 'pink', 'orange', 
-            'purple', 'brown', 'grey', 'gray', 'cream', 'beige', 'burgundy', 'khaki', 
-            'chocolate', 'milk', 'vanilla', 'scarlet', 'lilac', 'lime', 'bronze',
-            # Дополнительные варианты
-            'bordo', 'light-beige', 'dark-green', 'dark-denim'
-        ]
-        
-        return color_lower in valid_colors
+        return self._attributes.is_valid_color(color)
 
     async def get_categories(self):
         """Получение списка категорий из МойСклад"""
@@ -730,35 +1592,30 @@ class MoySkladAPI:
             params = {'limit': 1000, 'offset': 0}
             
             print(f"📡 Запрос категорий к: {url}")
-            print(f"🔑 Headers: {self.headers}")
             print(f"📝 Params: {params}")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers, params=params) as response:
-                    print(f"📊 Статус ответа категорий: {response.status}")
+            try:
+                data = await self._get_json(url, params)
+            except MoySkladAPIError as e:
+                print(f"❌ Ошибка API МойСклад при получении категорий: {e.status}")
+                print(f"📄 Текст ошибки: {e.message}")
+                return self._get_test_categories()
 
-                    if response.status == 200:
-                        data = await response.json()
-                        print(f"📦 Получено категорий: {len(data.get('rows', []))}")
-                        print(f"📄 Структура ответа категорий: {list(data.keys())}")
-                        
-                        if data.get('rows'):
-                            first_item = data['rows'][0]
-                            print(f"🔍 Первая категория: {first_item}")
-                        
-                        categories = []
-                        for item in data.get('rows', []):
-                            categories.append({
-                                'id': item.get('id'),
-                                'name': item.get('name', 'Без названия')
-                            })
-                        
-                        return categories
-                    else:
-                        error_text = await response.text()
-                        print(f"❌ Ошибка API МойСклад при получении категорий: {response.status}")
-                        print(f"📄 Текст ошибки: {error_text}")
-                        return self._get_test_categories()
+            print(f"📦 Получено категорий: {len(data.get('rows', []))}")
+            print(f"📄 Структура ответа категорий: {list(data.keys())}")
+                
+            if data.get('rows'):
+                first_item = data['rows'][0]
+                print(f"🔍 Первая категория: {first_item}")
+                
+            categories = []
+            for item in data.get('rows', []):
+                categories.append({
+                    'id': item.get('id'),
+                    'name': item.get('name', 'Без названия')
+                })
+                
+            return categories
 
         except Exception as e:
             print(f"💥 Исключение при получении категорий: {e}")
@@ -771,14 +1628,11 @@ class MoySkladAPI:
         print(f"🔍 Поиск товара по ID: {product_id}")
         
         try:
-            # Получаем все товары и ищем нужный
-            products = await self.get_products(limit=1000, offset=0)
-            
-            # Ищем товар по ID
-            for product in products:
-                if product.get('original_id') == product_id:
-                    print(f"✅ Товар найден: {product.get('name')}")
-                    return product
+            snapshot = await self.get_snapshot()
+            product = snapshot.get(product_id)
+            if product is not None:
+                print(f"✅ Товар найден: {product.name}")
+                return product.to_dict()
             
             print(f"❌ Товар не найден для ID: {product_id}")
             return None
@@ -819,94 +1673,11 @@ class MoySkladAPI:
             }
         ]
 
-    def _get_basic_auth_header(self):
-        """Получение заголовка Basic Auth для МойСклад"""
-        from config import MOYSKLAD_LOGIN, MOYSKLAD_PASSWORD
-        
-        if not MOYSKLAD_LOGIN or not MOYSKLAD_PASSWORD:
-            print("⚠️ Данные для Basic Auth МойСклад не настроены")
-            return None
-            
-        credentials = f"{MOYSKLAD_LOGIN}:{MOYSKLAD_PASSWORD}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        return {'Authorization': f'Basic {encoded_credentials}'}
-
-    def get_access_token(self):
-        """Получение нового access token от МойСклад"""
-        url = "https://api.moysklad.ru/api/remap/1.2/security/token"
-        headers = self._get_basic_auth_header()
-        
-        if not headers:
-            print("❌ Не удалось создать заголовки Basic Auth")
-            return None
-            
-        try:
-            print("🔄 Получаем новый токен от МойСклад...")
-            resp = requests.post(url, headers=headers)
-            
-            if resp.status_code // 100 != 2:
-                print(f"❌ Ошибка получения токена MoySklad: {resp.status_code} {resp.text}")
-                return None
-                
-            data = resp.json()
-            new_token = data.get("access_token")
-            
-            if new_token:
-                print(f"✅ Получен новый токен: {new_token[:20]}...")
-                return new_token
-            else:
-                print("❌ Токен не найден в ответе")
-                return None
-                
-        except Exception as e:
-            print(f"💥 Ошибка при получении токена: {e}")
-            return None
-
-    def _refresh_token_if_needed(self):
-        """Обновление токена при необходимости"""
-        try:
-            # Проверяем, работает ли текущий токен
-            test_url = f"{self.base_url}/entity/product?limit=1"
-            test_response = requests.get(test_url, headers=self.headers)
-            
-            if test_response.status_code == 401:
-                print("🔄 Токен истек, получаем новый...")
-                new_token = self.get_access_token()
-                
-                if new_token:
-                    self.api_token = new_token
-                    self.headers['Authorization'] = f'Bearer {new_token}'
-                    print("✅ Токен обновлен")
-                    
-                    # Обновляем конфигурацию
-                    from config import MOYSKLAD_API_TOKEN
-                    import config
-                    config.MOYSKLAD_API_TOKEN = new_token
-                else:
-                    print("❌ Не удалось обновить токен")
-            else:
-                print("✅ Токен работает корректно")
-                
-        except Exception as e:
-            print(f"💥 Ошибка при проверке токена: {e}")
-
-    def refresh_token(self):
+    async def refresh_token(self) -> bool:
         """Принудительное обновление токена"""
         print("🔄 Принудительное обновление токена...")
-        new_token = self.get_access_token()
-        
-        if new_token:
-            self.api_token = new_token
-            self.headers['Authorization'] = f'Bearer {new_token}'
+        if await self._tokens.refresh():
             print("✅ Токен обновлен")
-            
-            # Обновляем конфигурацию
-            import config
-            config.MOYSKLAD_API_TOKEN = new_token
-            
-            # Очищаем кэш для перезагрузки данных
-            self.clear_cache()
             return True
-        else:
-            print("❌ Не удалось обновить токен")
-            return False
+        print("❌ Не удалось обновить токен")
+        return False
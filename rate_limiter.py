@@ -0,0 +1,139 @@
+"""
+Ограничение частоты и параллельности запросов к МойСклад
+Лимиты МойСклад: не больше 45 запросов за 3 секунды и 5 параллельных запросов
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import Dict, Mapping, Optional
+
+# Приоритеты запросов: меньше - раньше
+PRIORITY_NORMAL = 0  # Фиды каталога, остатки, запросы пользователя
+PRIORITY_LOW = 1  # Фоновая загрузка изображений
+
+
+class RateLimiter:
+    """Token bucket с ограничением параллельных запросов и приоритетами
+
+    Запрос получает слот, когда в корзине есть токен, число выполняющихся
+    запросов меньше max_parallel и МойСклад не попросил подождать. Ожидающие
+    обслуживаются по приоритету, при равном приоритете - по очереди.
+    Заголовки ответа (X-RateLimit-Remaining, X-Lognex-Reset, Retry-After)
+    корректируют локальную оценку лимита.
+    """
+
+    def __init__(self, rate_limit: int = 45, period: float = 3, max_parallel: int = 5):
+        self.rate_limit = rate_limit
+        self.period = period
+        self.max_parallel = max_parallel
+        self._tokens = float(rate_limit)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._active = 0
+        self._waiters = []  # heap: (приоритет, порядковый номер, future)
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.throttled = 0  # Сколько раз МойСклад ответил 429
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL):
+        """Слот на один запрос (держится до закрытия ответа)"""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже выдан, но запрос отменен - возвращаем его
+                self._release()
+            raise
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(float(self.rate_limit), self._tokens + elapsed * self.rate_limit / self.period)
+
+    def _dispatch(self):
+        """Выдача слотов ожидающим, пока позволяют лимиты"""
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and self._active < self.max_parallel:
+            _, _, waiter = self._waiters[0]
+            if waiter.done():
+                # Ожидание отменено
+                heapq.heappop(self._waiters)
+                continue
+            delay = max(self._paused_until - now, (1 - self._tokens) * self.period / self.rate_limit)
+            if delay > 0:
+                self._schedule_dispatch(delay)
+                return
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            self._active += 1
+            waiter.set_result(None)
+
+    def _schedule_dispatch(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Поправка оценки лимита по заголовкам ответа МойСклад"""
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        if remaining is not None and remaining < self._tokens:
+            self._tokens = remaining
+        if remaining == 0:
+            reset_ms = _header_number(headers, 'X-Lognex-Reset')
+            if reset_ms:
+                self.pause(reset_ms / 1000)
+
+    def retry_after(self, headers: Mapping[str, str]) -> float:
+        """Пауза перед повтором после 429 (секунды)"""
+        retry_after_ms = _header_number(headers, 'X-Lognex-Retry-After')
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000
+        retry_after = _header_number(headers, 'Retry-After')
+        if retry_after is not None:
+            return retry_after
+        return self.period
+
+    def pause(self, seconds: float):
+        """Не выдавать слоты ближайшие seconds секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 0)
+
+    def stats(self) -> Dict[str, float]:
+        """Текущее состояние ограничителя"""
+        self._refill(time.monotonic())
+        return {
+            'tokens': round(self._tokens, 1),
+            'active': self._active,
+            'waiting': sum(1 for _, _, waiter in self._waiters if not waiter.done()),
+            'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+            'throttled': self.throttled
+        }
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
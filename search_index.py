@@ -0,0 +1,260 @@
+"""
+Полнотекстовый поиск по каталогу
+Обратный индекс строится для каждого снимка каталога: название, артикул, категория, цвета и размеры
+"""
+
+import bisect
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+from colors_sizes_reference import COLOR_SYNONYMS
+
+_WORDS = re.compile(r'\w+')
+_CYRILLIC = re.compile(r'[а-я]')
+
+# Окончания русских слов (прилагательные и существительные), длинные проверяются первыми
+_RU_ENDINGS = sorted({
+    'ый', 'ий', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ого', 'его', 'ому', 'ему',
+    'ым', 'им', 'ых', 'их', 'ую', 'юю', 'ыми', 'ими',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'ам', 'ям', 'ах', 'ях', 'ами', 'ями',
+    'ов', 'ев', 'ей', 'ом', 'ем', 'ия', 'ию', 'ии', 'ью'
+}, key=len, reverse=True)
+_MIN_STEM = 3
+
+_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's',
+    'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+_TO_CYRILLIC = [
+    ('shch', 'щ'), ('kh', 'х'), ('zh', 'ж'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'х'),
+    ('i', 'и'), ('j', 'й'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'),
+    ('q', 'к'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'), ('x', 'кс'),
+    ('y', 'ы'), ('z', 'з')
+]
+_LATIN_PATTERN = re.compile('|'.join(latin for latin, _ in _TO_CYRILLIC))
+_CYRILLIC_BY_LATIN = dict(_TO_CYRILLIC)
+
+# Вес совпадения по полю: совпадение в названии и артикуле важнее, чем в размере
+WEIGHT_NAME = 3.0
+WEIGHT_ARTICLE = 3.0
+WEIGHT_CATEGORY = 2.0
+WEIGHT_COLOR = 2.0
+WEIGHT_SIZE = 1.0
+
+
+def fold(text: str) -> str:
+    """Нижний регистр и ё -> е"""
+    return text.lower().replace('ё', 'е')
+
+
+def stem(word: str) -> str:
+    """Основа русского слова (отсечение окончания), латиница и числа не меняются"""
+    if not _CYRILLIC.search(word):
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def to_latin(word: str) -> str:
+    return ''.join(_TO_LATIN.get(char, char) for char in word)
+
+
+def to_cyrillic(word: str) -> str:
+    return _LATIN_PATTERN.sub(lambda match: _CYRILLIC_BY_LATIN[match.group(0)], word)
+
+
+@lru_cache(maxsize=100000)
+def terms(text: str) -> Tuple[str, ...]:
+    """Поисковые термины строки: слова без окончаний
+
+    Названия и категории повторяются от снимка к снимку, поэтому результат кэшируется.
+    """
+    return tuple(stem(word) for word in _WORDS.findall(fold(text)))
+
+
+def _color_aliases() -> Dict[str, str]:
+    """Написания цвета (русское, английское, транслитерация) -> ключ цвета (синий и голубой различаются)"""
+    aliases = {}
+    for color, normalized in COLOR_SYNONYMS.items():
+        color = fold(color)
+        forms = {color, to_latin(color), to_cyrillic(color)}
+        for form in forms:
+            aliases[form] = normalized
+            aliases[stem(form)] = normalized
+    return aliases
+
+
+COLOR_ALIASES = _color_aliases()
+
+
+def expand_term(word: str) -> Set[str]:
+    """Варианты термина запроса: основа слова и нормализованный цвет для названий цветов"""
+    word = fold(word)
+    expanded = {stem(word)}
+    normalized = COLOR_ALIASES.get(word) or COLOR_ALIASES.get(stem(word))
+    if normalized:
+        expanded.add(normalized)
+    return expanded
+
+
+@lru_cache(maxsize=1000)
+def color_terms(color: str) -> Tuple[str, ...]:
+    """Термины цвета товара: слова цвета и его нормализованное значение"""
+    result = set(terms(color))
+    normalized = COLOR_ALIASES.get(fold(color))
+    if normalized:
+        result.add(normalized)
+    return tuple(result)
+
+
+class SearchIndex:
+    """Обратный индекс: термин -> {позиция товара в снимке: вес}
+
+    Запрос находит товары, содержащие все его слова (в любом поле), и
+    ранжирует их по сумме весов полей, где слова нашлись. При равном весе
+    товары в наличии идут первыми, затем - в порядке каталога.
+    """
+
+    def __init__(self, products: Sequence):
+        self._products = products
+        self._postings: Dict[str, Dict[int, float]] = {}
+        for position, product in enumerate(products):
+            self._add(position, terms(product.name), WEIGHT_NAME)
+            if product.article:
+                self._add(position, terms(product.article), WEIGHT_ARTICLE)
+            self._add(position, terms(product.category), WEIGHT_CATEGORY)
+            for color in product.available_colors:
+                self._add(position, color_terms(color), WEIGHT_COLOR)
+            for size in product.available_sizes:
+                self._add(position, terms(size), WEIGHT_SIZE)
+
+    def _add(self, position: int, words: Iterable[str], weight: float):
+        for word in words:
+            postings = self._postings.setdefault(word, {})
+            if postings.get(position, 0) < weight:
+                postings[position] = weight
+
+    def __len__(self):
+        return len(self._postings)
+
+    def search(self, query: str) -> List[int]:
+        """Позиции найденных товаров в порядке релевантности"""
+        scores = None
+        for word in _WORDS.findall(query):
+            matches: Dict[int, float] = {}
+            for term in expand_term(word):
+                for position, weight in self._postings.get(term, {}).items():
+                    if matches.get(position, 0) < weight:
+                        matches[position] = weight
+            if scores is None:
+                scores = matches
+            else:
+                scores = {position: score + matches[position] for position, score in scores.items() if position in matches}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+
+        products = self._products
+        return sorted(scores, key=lambda position: (-scores[position], products[position].stock <= 0, position))
+
+    def page(self, query: str, limit: int, offset: int = 0) -> Tuple[List[int], int]:
+        """Страница результатов поиска: (позиции товаров, всего найдено)"""
+        positions = self.search(query)
+        return positions[offset:offset + limit], len(positions)
+
+
+class _PrefixArray:
+    """Отсортированный массив ключей для поиска по префиксу через bisect"""
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]]):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [key for key, _ in entries]
+        self.values = [value for _, value in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, prefix: str, scan_limit: int) -> List[Any]:
+        """Значения ключей с префиксом prefix (не больше scan_limit первых по алфавиту)"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = min(bisect.bisect_right(self.keys, prefix + '\uffff'), start + scan_limit)
+        return self.values[start:end]
+
+
+class SuggestIndex:
+    """Подсказки по префиксу: названия товаров, категории, цвета и размеры
+
+    Для каждого вида подсказок строится отсортированный массив ключей;
+    запрос - два бинарных поиска и просмотр не больше scan_limit
+    совпадений, поэтому время ответа и его размер не зависят от размера
+    каталога. Товар находится по началу любого слова названия, цвет - и
+    по русскому, и по латинскому написанию.
+    """
+
+    def __init__(self, products: Sequence, scan_limit: int = 200):
+        self.scan_limit = scan_limit
+        name_entries = []
+        category_counts: Dict[str, int] = {}
+        color_counts: Dict[str, Tuple[str, int]] = {}
+        size_counts: Dict[str, Tuple[str, int]] = {}
+        for position, product in enumerate(products):
+            folded = fold(product.name)
+            for word in _WORDS.finditer(folded):
+                name_entries.append((folded[word.start():], position))
+            category_counts[product.category] = category_counts.get(product.category, 0) + 1
+            for color in product.available_colors:
+                label, count = color_counts.get(fold(color), (color, 0))
+                color_counts[fold(color)] = (label, count + 1)
+            for size in product.available_sizes:
+                label, count = size_counts.get(fold(size), (size, 0))
+                size_counts[fold(size)] = (label, count + 1)
+
+        self._products = products
+        self._names = _PrefixArray(name_entries)
+        self._categories = _PrefixArray(
+            (fold(category)[word.start():], (category, count))
+            for category, count in category_counts.items()
+            for word in _WORDS.finditer(fold(category))
+        )
+        color_entries = []
+        for key, (label, count) in color_counts.items():
+            for form in {key, to_latin(key), to_cyrillic(key)}:
+                color_entries.append((form, (label, count)))
+        self._colors = _PrefixArray(color_entries)
+        self._sizes = _PrefixArray((key, value) for key, value in size_counts.items())
+
+    def __len__(self):
+        return len(self._names) + len(self._categories) + len(self._colors) + len(self._sizes)
+
+    def suggest(self, prefix: str, limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """Подсказки для префикса: не больше limit записей каждого вида"""
+        prefix = fold(prefix).strip()
+        if not prefix:
+            return {'products': [], 'categories': [], 'colors': [], 'sizes': []}
+
+        # Товары в наличии первыми, при равенстве - по алфавиту
+        products = self._products
+        positions = sorted(set(self._names.match(prefix, self.scan_limit)),
+                           key=lambda position: (products[position].stock <= 0, fold(products[position].name)))
+        return {
+            'products': [
+                {'id': products[position].original_id, 'name': products[position].name}
+                for position in positions[:limit]
+            ],
+            'categories': self._top(self._categories, prefix, limit),
+            'colors': self._top(self._colors, prefix, limit),
+            'sizes': self._top(self._sizes, prefix, limit)
+        }
+
+    def _top(self, array: _PrefixArray, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """Самые частые значения с префиксом (без повторов)"""
+        counts = dict(array.match(prefix, self.scan_limit))
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{'name': label, 'count': count} for label, count in ranked[:limit]]
@@ -0,0 +1,74 @@
+"""
+Сортированные представления каталога: цена, новизна, наличие и популярность
+Перестановки позиций товаров строятся один раз для снимка и переиспользуются всеми запросами
+"""
+
+import bisect
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+SORT_PRICE_ASC = 'price_asc'
+SORT_PRICE_DESC = 'price_desc'
+SORT_NEWEST = 'newest'
+SORT_IN_STOCK_FIRST = 'in_stock_first'
+SORT_POPULARITY = 'popularity'
+
+SORTS = (SORT_PRICE_ASC, SORT_PRICE_DESC, SORT_NEWEST, SORT_IN_STOCK_FIRST, SORT_POPULARITY)
+
+
+class SortedViews:
+    """Перестановки позиций товаров снимка для каждого вида сортировки
+
+    Перестановка строится при первом запросе сортировки; при равенстве
+    ключа сохраняется порядок каталога. Популярность зависит от корзин и
+    заказов, поэтому ее перестановка пересобирается, когда передан новый
+    словарь популярности.
+    """
+
+    def __init__(self, products: Sequence):
+        self._products = products
+        self._orders: Dict[str, List[int]] = {}
+        self._popularity: Optional[Tuple[Mapping[str, int], List[int]]] = None
+        self._prices: Optional[List[float]] = None
+
+    def order(self, sort: str, popularity: Optional[Mapping[str, int]] = None) -> List[int]:
+        """Позиции товаров в порядке сортировки (ValueError для неизвестной сортировки)"""
+        if sort == SORT_POPULARITY:
+            return self._popularity_order(popularity or {})
+        if sort not in SORTS:
+            raise ValueError(f"Неизвестная сортировка: {sort}")
+        order = self._orders.get(sort)
+        if order is None:
+            order = self._orders[sort] = self._build(sort)
+        return order
+
+    def _build(self, sort: str) -> List[int]:
+        products = self._products
+        positions = range(len(products))
+        if sort == SORT_PRICE_ASC:
+            return sorted(positions, key=lambda position: products[position].price)
+        if sort == SORT_PRICE_DESC:
+            # reverse=True в sorted сохраняет порядок каталога для равных цен
+            return sorted(positions, key=lambda position: products[position].price, reverse=True)
+        if sort == SORT_NEWEST:
+            return sorted(positions, key=lambda position: products[position].updated or '', reverse=True)
+        return sorted(positions, key=lambda position: products[position].stock <= 0)
+
+    def _popularity_order(self, popularity: Mapping[str, int]) -> List[int]:
+        if self._popularity is None or self._popularity[0] is not popularity:
+            products = self._products
+            order = sorted(range(len(products)),
+                           key=lambda position: popularity.get(products[position].original_id, 0), reverse=True)
+            self._popularity = (popularity, order)
+        return self._popularity[1]
+
+    def price_range(self, low: float, high: float) -> List[int]:
+        """Позиции товаров с ценой в [low, high) (бинарный поиск по отсортированным ценам)"""
+        order = self.order(SORT_PRICE_ASC)
+        if self._prices is None:
+            self._prices = [self._products[position].price for position in order]
+        return order[bisect.bisect_left(self._prices, low):bisect.bisect_left(self._prices, high)]
+
+    def page(self, sort: str, limit: int, offset: int = 0,
+             popularity: Optional[Mapping[str, int]] = None) -> List[int]:
+        """Страница позиций всего каталога в порядке сортировки"""
+        return self.order(sort, popularity)[offset:offset + limit]
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Клиент МойСклад без снимка на диске и с базой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    from moysklad_api import MoySkladAPI
+    client = MoySkladAPI(api_token='test-token')
+    client._snapshot_path = None
+    return client
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Тестовый клиент веб-приложения без запуска lifespan (МойСклад не вызывается)"""
+    import database
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / 'shop.db'))
+    from fastapi.testclient import TestClient
+    import webapp
+    return TestClient(webapp.app)
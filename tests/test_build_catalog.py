@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from moysklad_api import MoySkladAPIError
+
+PRODUCTS = [
+    {'id': f'p{index}', 'name': f'Платье {index}', 'updated': f'2024-01-01 00:00:0{index}.000',
+     'salePrices': [{'value': 150000}], 'pathName': 'Платья'}
+    for index in range(3)
+]
+VARIANTS = [
+    {'id': f'v{index}', 'name': f'Платье {index} (44, черный)', 'updated': '2024-01-01 00:00:00.000',
+     'characteristics': [{'name': 'Размер', 'value': '44'}, {'name': 'Цвет', 'value': 'черный'}],
+     'salePrices': [{'value': 150000}], 'product': {'id': f'p{index}'}}
+    for index in range(3)
+]
+STOCK = {f'v{index}': 2.0 for index in range(3)}
+
+
+def _feeds(api, products=None, variants=None, stock=None):
+    """Подмена фидов МойСклад: исключение вместо списка - сбой фида"""
+
+    async def stream(rows):
+        if isinstance(rows, Exception):
+            raise rows
+        for row in rows:
+            yield row
+
+    async def get_stock():
+        if isinstance(stock, Exception):
+            raise stock
+        return dict(stock)
+
+    api._stream_products = lambda updated_since=None: stream(products)
+    api._stream_variants = lambda updated_since=None: stream(variants)
+    api._get_stock_all = get_stock
+
+
+def test_failed_feed_is_replaced_by_last_full_load(api):
+    _feeds(api, PRODUCTS, VARIANTS, STOCK)
+    first = asyncio.run(api._build_catalog())
+    stock_mark = api._stock_mark
+
+    changed = [dict(PRODUCTS[0], name='Платье новое', updated='2024-01-02 00:00:00.000')] + PRODUCTS[1:]
+    _feeds(api, changed, MoySkladAPIError(503, 'Service Unavailable'), {'v0': 5.0})
+    second = asyncio.run(api._build_catalog())
+
+    assert [product.original_id for product in second] == [product.original_id for product in first]
+    # Товары и остатки - новые, модификации - из прошлой полной загрузки
+    assert second[0].name == 'Платье новое'
+    assert [len(product.variants) for product in second] == [1, 0, 0]
+    assert second[0].stock == 5
+    assert set(api._source.variants) == {'v0', 'v1', 'v2'}
+    # Метка не сдвигается: изменения модификаций заберет инкрементальная синхронизация
+    assert api._source.updated_mark == '2024-01-01 00:00:02.000'
+    assert api._stock_mark >= stock_mark
+
+
+def test_failed_stock_keeps_previous_stock_mark(api):
+    _feeds(api, PRODUCTS, VARIANTS, STOCK)
+    asyncio.run(api._build_catalog())
+    stock_mark, stock_synced_at = api._stock_mark, api._stock_synced_at
+
+    _feeds(api, PRODUCTS, VARIANTS, MoySkladAPIError(502, 'Bad Gateway'))
+    products = asyncio.run(api._build_catalog())
+
+    assert [product.stock for product in products] == [2, 2, 2]
+    assert (api._stock_mark, api._stock_synced_at) == (stock_mark, stock_synced_at)
+
+
+def test_failed_feed_without_previous_load_fails_rebuild(api):
+    _feeds(api, PRODUCTS, MoySkladAPIError(503, 'Service Unavailable'), STOCK)
+    with pytest.raises(MoySkladAPIError):
+        asyncio.run(api._build_catalog())
+    assert api._source is None
+
+
+def test_colour_and_size_synonyms_collapse_to_one_value(api):
+    variants = [
+        {'id': 'v1', 'name': 'Платье (44, Bordo)', 'updated': '1',
+         'characteristics': [{'name': 'Размер', 'value': '44'}, {'name': 'Цвет', 'value': 'Bordo'}]},
+        {'id': 'v2', 'name': 'Платье (44, бордовый)', 'updated': '1',
+         'characteristics': [{'name': 'Размер', 'value': '44'}, {'name': 'Цвет', 'value': 'бордовый'}]},
+        # Без характеристик размер и цвет берутся из названия
+        {'id': 'v3', 'name': 'Платье (one size, черный)', 'updated': '1'},
+        {'id': 'v4', 'name': 'Платье (OS, black)', 'updated': '1'},
+    ]
+    product = api._build_product(PRODUCTS[0], variants, {'v1': 1, 'v2': 2, 'v3': 1, 'v4': 4}, {})
+
+    assert product.available_colors == ('Bordo', 'черный')
+    assert product.available_sizes == ('44', 'one size')
+    # Модификации записаны в написании товара, и матрица остатков находит обе
+    assert [variant.colors for variant in product.variants] == [('Bordo',), ('Bordo',), ('черный',), ('черный',)]
+    assert product.available('Bordo', '44') == 3
+    assert product.available('черный', 'one size') == 5
+
+    # Синий и голубой - одно семейство справочника (blue), но не синонимы
+    variants = [
+        {'id': 'v5', 'name': 'Платье (44, синий)', 'updated': '1',
+         'characteristics': [{'name': 'Размер', 'value': '44'}, {'name': 'Цвет', 'value': 'синий'}]},
+        {'id': 'v6', 'name': 'Платье (44, голубой)', 'updated': '1',
+         'characteristics': [{'name': 'Размер', 'value': '44'}, {'name': 'Цвет', 'value': 'голубой'}]},
+        {'id': 'v7', 'name': 'Платье (44, серый)', 'updated': '1'},
+        {'id': 'v8', 'name': 'Платье (44, светло-серый)', 'updated': '1'},
+    ]
+    product = api._build_product(PRODUCTS[0], variants, {'v5': 1, 'v6': 3, 'v7': 2, 'v8': 5}, {})
+
+    assert product.available_colors == ('синий', 'голубой', 'серый', 'светло-серый')
+    assert [variant.colors for variant in product.variants] == [('синий',), ('голубой',), ('серый',), ('светло-серый',)]
+    assert product.available('синий', '44') == 1
+    assert product.available('голубой', '44') == 3
+    assert product.available('серый', '44') == 2
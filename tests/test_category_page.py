@@ -0,0 +1,68 @@
+import pytest
+
+from catalog import CatalogSnapshot, Product, encode_cursor
+
+
+def _product(index, category='Платья'):
+    return Product.create(f'Товар {index}', f'p{index}', f'Товар {index}', '', '', 1000, 1, category)
+
+
+def _catalog(indexes, version):
+    return CatalogSnapshot([_product(index, 'Платья' if index % 2 == 0 else 'Джинсы') for index in indexes],
+                           version=version)
+
+
+def _ids(products):
+    return [product.original_id for product in products]
+
+
+def test_cursor_walks_category_without_repeats():
+    snapshot = _catalog(range(20), 'v1')
+    seen, cursor = [], None
+    while True:
+        products, cursor = snapshot.category_page('Платья', 3, cursor=cursor)
+        seen += _ids(products)
+        if cursor is None:
+            break
+    assert seen == [f'p{index}' for index in range(0, 20, 2)]
+
+
+def test_offset_page_without_cursor():
+    snapshot = _catalog(range(20), 'v1')
+    products, cursor = snapshot.category_page(None, 5, offset=17)
+    assert _ids(products) == ['p17', 'p18', 'p19']
+    assert cursor is None
+
+
+def test_cursor_resumes_after_last_item_in_new_snapshot():
+    old = _catalog(range(20), 'v1')
+    products, cursor = old.category_page('Платья', 3)
+    assert _ids(products) == ['p0', 'p2', 'p4']
+
+    # В новом снимке перед уже отданными товарами появились новые
+    new = CatalogSnapshot([_product(100), _product(102)] + old.products, version='v2')
+    products, _ = new.category_page('Платья', 3, cursor=cursor)
+    assert _ids(products) == ['p6', 'p8', 'p10']
+
+
+def test_cursor_falls_back_to_offset_when_last_item_is_gone():
+    old = _catalog(range(20), 'v1')
+    _, cursor = old.category_page('Платья', 3)
+    new = _catalog([index for index in range(20) if index != 4], 'v2')
+    products, _ = new.category_page('Платья', 3, cursor=cursor)
+    assert _ids(products) == ['p8', 'p10', 'p12']
+
+
+def test_cursor_from_another_category_is_rejected():
+    snapshot = _catalog(range(20), 'v1')
+    _, cursor = snapshot.category_page('Платья', 3)
+    with pytest.raises(ValueError):
+        snapshot.category_page('Джинсы', 3, cursor=cursor)
+
+
+@pytest.mark.parametrize('cursor', ['@@@', encode_cursor({'v': 'v1', 'c': '', 'o': -1}),
+                                    encode_cursor({'v': 'v1', 'c': '', 'o': '3'})])
+def test_broken_cursor_is_rejected(cursor):
+    snapshot = _catalog(range(5), 'v1')
+    with pytest.raises(ValueError):
+        snapshot.category_page(None, 3, cursor=cursor)
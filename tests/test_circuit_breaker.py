@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from moysklad_api import MoySkladAPIError
+
+
+def test_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure('HTTP 502')
+    breaker.before_call()
+    breaker.record_failure('HTTP 502')
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_probe_after_timeout_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()  # Пробный запрос
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Остальные ждут результата пробного
+    breaker.record_success()
+    assert not breaker.is_open
+    breaker.before_call()
+
+
+def test_failed_probe_keeps_breaker_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+async def _serve(handler):
+    app = web.Application()
+    app.router.add_get('/entity', handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_brief_5xx_blip_is_absorbed_by_retries(api):
+    async def scenario():
+        started = time.monotonic()
+
+        async def handler(request):
+            # МойСклад отвечает 502 первые 300 мс
+            if time.monotonic() - started < 0.3:
+                return web.Response(status=502, text='Bad Gateway')
+            return web.json_response({'rows': [], 'meta': {'size': 0}})
+
+        server = await _serve(handler)
+        try:
+            url = str(server.make_url('/entity'))
+            # Столько же параллельных вызовов, сколько слотов у ограничителя и порог предохранителя
+            results = await asyncio.gather(*(api._get_json(url, {}) for _ in range(5)))
+        finally:
+            await api.close()
+            await server.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert results == [{'rows': [], 'meta': {'size': 0}}] * 5
+    assert not api._circuit.is_open
+
+
+def test_breaker_opens_when_calls_exhaust_retries(api):
+    api._retry_base_delay = 0.01
+    api._retry_max_delay = 0.01
+
+    async def scenario():
+        attempts = 0
+
+        async def handler(request):
+            nonlocal attempts
+            attempts += 1
+            return web.Response(status=503, text='Service Unavailable')
+
+        server = await _serve(handler)
+        try:
+            url = str(server.make_url('/entity'))
+            results = await asyncio.gather(*(api._get_json(url, {}) for _ in range(5)), return_exceptions=True)
+            with pytest.raises(CircuitOpenError):
+                await api._get_json(url, {})
+        finally:
+            await api.close()
+            await server.close()
+        return results, attempts
+
+    results, attempts = asyncio.run(scenario())
+    assert all(isinstance(result, MoySkladAPIError) for result in results)
+    # Каждый вызов успел выполнить все повторы до размыкания
+    assert attempts == 5 * (api._max_retries + 1)
+    assert api._circuit.is_open
@@ -0,0 +1,110 @@
+import pytest
+
+from catalog import CatalogSnapshot, Product
+from bitsets import bit_positions, bitset
+from facets import FacetIndex, parse_filter
+
+
+def _product(index, category, price, stock=1, colors=('черный',), sizes=('44',)):
+    return Product.create(f'Товар {index}', f'p{index}', f'Товар {index}', '', '', price, stock, category,
+                          colors, sizes)
+
+
+PRODUCTS = [
+    _product(0, 'Платья', 999, colors=('черный',), sizes=('42',)),
+    _product(1, 'Платья', 1000, colors=('белый',), sizes=('44',)),
+    _product(2, 'Платья', 1999, colors=('черный', 'белый'), sizes=('44', '46')),
+    _product(3, 'Джинсы', 2000, colors=('Bordo',), sizes=('46',)),
+    _product(4, 'Джинсы', 2000, stock=0, colors=('бордовый',), sizes=('M',)),
+    _product(5, 'Топы', 15000, colors=('черный',), sizes=('S',)),
+]
+
+
+def _counts(facets, facet):
+    return {entry['value']: entry['count'] for entry in facets[facet]}
+
+
+def test_parse_filter_groups_values_and_rejects_unknown():
+    assert parse_filter('color=white, black;size=42;price=1000-;in_stock=1') == {
+        'color': ['white', 'black'], 'size': ['42'], 'price': ['1000-'], 'in_stock': ['1']
+    }
+    with pytest.raises(ValueError):
+        parse_filter('weight=1')
+    with pytest.raises(ValueError):
+        parse_filter('price=abc-1')
+
+
+def test_apply_intersects_facets_and_unions_values():
+    index = FacetIndex(PRODUCTS)
+    mask, _ = index.apply({'color': ['белый', 'bordo'], 'in_stock': ['1']})
+    assert bit_positions(mask) == [1, 2, 3]
+
+
+def test_color_synonyms_share_one_value():
+    index = FacetIndex(PRODUCTS)
+    mask, _ = index.apply({'color': ['бордовый']})
+    assert bit_positions(mask) == [3, 4]
+
+
+def test_color_family_is_not_a_synonym():
+    index = FacetIndex([_product(0, 'Платья', 999, colors=('синий',)), _product(1, 'Платья', 999, colors=('голубой',)),
+                        _product(2, 'Платья', 999, colors=('blue',))])
+    mask, facets = index.apply({'color': ['голубой']})
+    assert bit_positions(mask) == [1]
+    assert _counts(facets, 'color') == {'blue': 2, 'light-blue': 1}
+
+
+def test_counts_ignore_own_facet_filter():
+    index = FacetIndex(PRODUCTS)
+    _, facets = index.apply({'category': ['Платья'], 'size': ['44']})
+    # Категории посчитаны только с фильтром по размеру, размеры - только с категорией
+    assert _counts(facets, 'category') == {'Платья': 2}
+    assert _counts(facets, 'size') == {'42': 1, '44': 2, '46': 1}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1000-2000', [1, 2]),  # Совпадает с диапазоном фасета
+    ('1000-2001', [1, 2, 3, 4]),
+    ('999-2000', [0, 1, 2]),
+    ('2000-', [3, 4, 5]),
+    ('-1000', [0]),
+])
+def test_price_ranges_include_low_and_exclude_high(value, expected):
+    index = FacetIndex(PRODUCTS)
+    mask, _ = index.apply({'price': [value]})
+    assert bit_positions(mask) == expected
+
+
+def test_scope_is_anded_with_category_filter():
+    snapshot = CatalogSnapshot(list(PRODUCTS))
+    products, total, facets = snapshot.filter_page({'category': ['Джинсы']}, 10, category='Платья')
+    assert (products, total) == ([], 0)
+
+    products, total, facets = snapshot.filter_page({'color': ['черный']}, 10, category='Платья')
+    assert [product.original_id for product in products] == ['p0', 'p2']
+    assert total == 2
+    # Счетчики тоже посчитаны внутри категории
+    assert _counts(facets, 'category') == {'Платья': 2}
+    assert _counts(facets, 'color') == {'black': 2, 'white': 2}
+
+
+def test_bit_positions_pages_through_mask():
+    positions = [0, 3, 9, 64, 65, 130] + list(range(1000, 40000, 3))
+    mask = bitset(positions, 40000)
+    assert bit_positions(mask) == positions
+    assert bit_positions(mask, 2) == [0, 3]
+    assert bit_positions(mask, 3, 4) == [65, 130, 1000]
+    assert bit_positions(mask, 5, 10000) == positions[10000:10005]
+    assert bit_positions(mask, 5, len(positions)) == []
+    assert bit_positions(0) == []
+
+
+def test_sorted_filter_page_uses_sort_order():
+    snapshot = CatalogSnapshot(list(PRODUCTS))
+    products, total, _ = snapshot.filter_page({'in_stock': ['1']}, 2, 1, sort='price_desc', category='Платья')
+    assert [product.original_id for product in products] == ['p1', 'p0']
+    assert total == 3
+
+    products, total = snapshot.sorted_page('price_asc', 'Джинсы', 10)
+    assert [product.original_id for product in products] == ['p3', 'p4']
+    assert total == 2
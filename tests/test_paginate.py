@@ -0,0 +1,31 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+TOTAL = 95
+PAGE_SIZE = 10
+
+
+def test_pages_are_yielded_in_offset_order(api):
+    async def scenario():
+        async def handler(request):
+            offset = int(request.query['offset'])
+            limit = int(request.query['limit'])
+            # Поздние страницы отвечают быстрее ранних
+            await asyncio.sleep(0.002 * (TOTAL - offset) / PAGE_SIZE)
+            rows = [{'id': str(index)} for index in range(offset, min(offset + limit, TOTAL))]
+            return web.json_response({'meta': {'size': TOTAL}, 'rows': rows})
+
+        app = web.Application()
+        app.router.add_get('/entity', handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            url = str(server.make_url('/entity'))
+            return [row['id'] async for row in api._paginate(url, page_size=PAGE_SIZE)]
+        finally:
+            await api.close()
+            await server.close()
+
+    assert asyncio.run(scenario()) == [str(index) for index in range(TOTAL)]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from rate_limiter import PRIORITY_LOW, PRIORITY_NORMAL, RateLimiter
+
+
+def test_parallel_requests_are_capped():
+    limiter = RateLimiter(rate_limit=100, period=1, max_parallel=2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.stats()['active'])
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak == 2
+    assert limiter.stats()['active'] == 0
+
+
+def test_token_bucket_spreads_requests_over_period():
+    limiter = RateLimiter(rate_limit=5, period=0.5, max_parallel=10)
+
+    async def scenario():
+        started = time.monotonic()
+
+        async def call():
+            async with limiter.slot():
+                pass
+
+        await asyncio.gather(*(call() for _ in range(10)))
+        return time.monotonic() - started
+
+    # 5 запросов сразу из полной корзины, еще 5 - по мере пополнения (0.1с на токен)
+    assert asyncio.run(scenario()) >= 0.4
+
+
+def test_waiters_are_served_by_priority_then_fifo():
+    limiter = RateLimiter(rate_limit=100, period=1, max_parallel=1)
+    order = []
+
+    async def call(name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        first = asyncio.create_task(call('first', PRIORITY_NORMAL))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(call('image', PRIORITY_LOW)),
+            asyncio.create_task(call('feed-1', PRIORITY_NORMAL)),
+            asyncio.create_task(call('feed-2', PRIORITY_NORMAL))
+        ]
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(scenario())
+    assert order == ['first', 'feed-1', 'feed-2', 'image']
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    limiter = RateLimiter(rate_limit=100, period=1, max_parallel=1)
+
+    async def scenario():
+        async with limiter.slot():
+            waiter = asyncio.create_task(limiter.slot().__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        async with limiter.slot():
+            return limiter.stats()['active']
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_headers_adjust_tokens_and_pause():
+    limiter = RateLimiter(rate_limit=45, period=3, max_parallel=5)
+    limiter.update_from_headers({'X-RateLimit-Remaining': '10'})
+    assert limiter.stats()['tokens'] <= 10.1
+
+    limiter.update_from_headers({'X-RateLimit-Remaining': '0', 'X-Lognex-Reset': '1500'})
+    assert 1.4 <= limiter.stats()['paused_for'] <= 1.5
+
+
+def test_retry_after_prefers_lognex_header():
+    limiter = RateLimiter(rate_limit=45, period=3)
+    assert limiter.retry_after({'X-Lognex-Retry-After': '250', 'Retry-After': '5'}) == 0.25
+    assert limiter.retry_after({'Retry-After': '2'}) == 2
+    assert limiter.retry_after({}) == 3
+
+
+def test_429_pauses_queued_requests_before_releasing_slot(api):
+    api._rate_limiter = RateLimiter(rate_limit=45, period=3, max_parallel=1)
+
+    async def scenario():
+        arrivals = []
+
+        async def handler(request):
+            arrivals.append((request.query.get('n'), time.monotonic()))
+            if len(arrivals) == 1:
+                # Без X-RateLimit-Remaining: 0 - пауза известна только из Retry-After
+                return web.Response(status=429, headers={'X-Lognex-Retry-After': '300'})
+            return web.json_response({'rows': []})
+
+        app = web.Application()
+        app.router.add_get('/entity', handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            url = str(server.make_url('/entity'))
+            first = asyncio.create_task(api._get_json(url, {'n': 'first'}))
+            await asyncio.sleep(0)
+            queued = asyncio.create_task(api._get_json(url, {'n': 'queued'}))
+            await asyncio.gather(first, queued)
+        finally:
+            await api.close()
+            await server.close()
+        return arrivals
+
+    arrivals = asyncio.run(scenario())
+    throttled_at = arrivals[0][1]
+    assert len(arrivals) == 3
+    assert all(at - throttled_at >= 0.29 for _, at in arrivals[1:])
@@ -0,0 +1,25 @@
+from catalog import Product
+from search_index import SearchIndex
+
+
+def _product(index, name, colors):
+    return Product.create(name, f'p{index}', name, '', '', 1000, 1, 'Платья', colors, ('44',))
+
+
+PRODUCTS = [
+    _product(0, 'Платье миди', ('синий',)),
+    _product(1, 'Платье макси', ('голубой',)),
+    _product(2, 'Платье мини', ('Bordo',)),
+]
+
+
+def test_color_synonyms_match_across_languages():
+    index = SearchIndex(PRODUCTS)
+    assert index.search('бордовое платье') == [2]
+    assert index.search('blue') == [0]
+
+
+def test_color_family_is_not_a_synonym():
+    index = SearchIndex(PRODUCTS)
+    assert index.search('голубой') == [1]
+    assert index.search('синее платье') == [0]
@@ -0,0 +1,42 @@
+import asyncio
+
+
+def test_close_cancels_background_work_before_closing_session(api):
+    session_open_when_cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            session_open_when_cancelled.append(not api._session.closed)
+            raise
+
+    async def scenario():
+        await api.start()
+        api._refresh_task = asyncio.create_task(hang())
+        api._stock_refresh_task = asyncio.create_task(hang())
+        image_task = asyncio.create_task(hang())
+        api._image_tasks.add(image_task)
+        image_task.add_done_callback(api._image_tasks.discard)
+        await asyncio.sleep(0)
+        await api.close()
+        return image_task
+
+    image_task = asyncio.run(scenario())
+    assert session_open_when_cancelled == [True, True, True]
+    assert image_task.cancelled()
+    assert api._refresh_task is None and api._stock_refresh_task is None
+    assert api._session is None
+
+
+def test_stop_scheduler_cancels_running_refresh(api):
+    async def scenario():
+        api._scheduler_task = asyncio.create_task(asyncio.sleep(60))
+        api._stock_scheduler_task = asyncio.create_task(asyncio.sleep(60))
+        refresh = api._refresh_task = asyncio.create_task(asyncio.sleep(60))
+        await asyncio.sleep(0)
+        await api.stop_scheduler()
+        return refresh
+
+    assert asyncio.run(scenario()).cancelled()
+    assert api._refresh_task is None
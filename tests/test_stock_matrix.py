@@ -0,0 +1,25 @@
+from catalog import Product, Variant, build_stock_matrix
+
+
+def test_cells_sum_variants_sharing_colour_and_size():
+    variants = [
+        Variant.create('v1', 'Платье (44, черный)', 2, ('44',), ('черный',)),
+        Variant.create('v2', 'Платье (44, черный) партия 2', 3, ('44',), ('черный',)),
+        Variant.create('v3', 'Платье (46, черный)', 1, ('46',), ('черный',)),
+    ]
+    matrix = build_stock_matrix(variants)
+    assert matrix[('черный', '44')] == (None, 5)
+    assert matrix[(None, '44')] == (None, 5)
+    assert matrix[('черный', '46')] == ('v3', 1)
+    assert matrix[('черный', None)] == (None, 6)
+
+
+def test_available_matches_wildcard_totals():
+    variants = [
+        Variant.create('v1', 'Платье (44, черный)', 2, ('44',), ('черный',)),
+        Variant.create('v2', 'Платье (44, черный)', 3, ('44',), ('черный',)),
+    ]
+    product = Product.create('Платье', 'p1', 'Платье', '', '', 1000, 5, 'Платья', ('черный',), ('44',), variants)
+    assert product.available('черный', '44') == product.available(size='44') == 5
+    assert product.available('белый', '44') == 0
+    assert product.available() == 5
@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    'offset=-1',
+    'limit=-5',
+    'limit=0',
+    'limit=100000',
+    'filter=color=black&offset=-1',
+    'sort=price_asc&offset=-1',
+    'sort=price_asc&category=Платья&offset=-1',
+])
+def test_products_reject_invalid_paging(client, query):
+    response = client.get(f'/api/products?{query}')
+    assert response.status_code == 422
+
+
+def test_search_rejects_negative_offset(client):
+    assert client.get('/api/search?q=платье&offset=-1').status_code == 422
+
+
+def test_webhook_is_disabled_without_secret(client, monkeypatch):
+    import webapp
+    monkeypatch.setattr(webapp, 'MOYSKLAD_WEBHOOK_SECRET', '')
+    accepted = []
+    monkeypatch.setattr(webapp.moysklad, 'handle_webhook', accepted.append)
+    assert client.post('/api/moysklad/webhook', json={'events': []}).status_code == 403
+    assert client.post('/api/moysklad/webhook?secret=', json={'events': []}).status_code == 403
+    assert accepted == []
+
+
+def test_webhook_checks_secret(client, monkeypatch):
+    import webapp
+    monkeypatch.setattr(webapp, 'MOYSKLAD_WEBHOOK_SECRET', 'hook-secret')
+    monkeypatch.setattr(webapp.moysklad, 'handle_webhook', lambda payload: 0)
+    assert client.post('/api/moysklad/webhook?secret=wrong', json={'events': []}).status_code == 403
+    response = client.post('/api/moysklad/webhook?secret=hook-secret', json={'events': []})
+    assert response.json() == {'success': True, 'accepted': 0}
@@ -0,0 +1,44 @@
+import asyncio
+
+STOCK_EVENT = {'events': [{'meta': {'type': 'demand', 'href': 'https://api/entity/demand/d1'}, 'action': 'UPDATE'}]}
+
+
+def test_stock_event_during_sync_is_retried_after_it(api):
+    api._webhook_debounce = 0.01
+    calls = []
+
+    async def refresh_stock():
+        calls.append(api._sync_lock.locked())
+
+    api._refresh_stock = refresh_stock
+
+    async def scenario():
+        async with api._sync_lock:
+            api.handle_webhook(STOCK_EVENT)
+            await asyncio.sleep(0.05)
+            assert calls == []
+        await asyncio.wait_for(api._webhook_task, 1)
+
+    asyncio.run(scenario())
+    assert calls == [False]
+    assert not api._webhook_stock
+
+
+def test_failed_batch_is_requeued_without_scheduler(api):
+    api._webhook_debounce = 0.01
+    api._refresh_retry_interval = 0.01
+    calls = []
+
+    async def refresh_stock():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError('МойСклад недоступен')
+
+    api._refresh_stock = refresh_stock
+
+    async def scenario():
+        api.handle_webhook(STOCK_EVENT)
+        await asyncio.wait_for(api._webhook_task, 1)
+
+    asyncio.run(scenario())
+    assert calls == [0, 1]
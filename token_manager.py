@@ -0,0 +1,100 @@
+"""
+Токен доступа МойСклад
+Токен обновляется асинхронно и только по ответу 401, одним запросом на всех
+"""
+
+import asyncio
+import base64
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+
+class TokenManager:
+    """Bearer-токен МойСклад с обновлением через /security/token
+
+    Одновременные 401 от разных запросов приводят к одному обновлению
+    (single-flight): остальные запросы ждут его результата. После неудачного
+    обновления повторная попытка возможна не раньше чем через
+    retry_after_failure секунд, чтобы не засыпать МойСклад запросами токена.
+    """
+
+    def __init__(self, token: Optional[str], token_url: str,
+                 get_session: Callable[[], Awaitable[aiohttp.ClientSession]],
+                 login: Optional[str] = None, password: Optional[str] = None,
+                 retry_after_failure: float = 30):
+        self.token = token
+        self._token_url = token_url
+        self._get_session = get_session
+        self._login = login
+        self._password = password
+        self._retry_after_failure = retry_after_failure
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._failed_at = 0
+        self.refreshed_at: Optional[float] = None
+
+    def auth_header(self) -> Dict[str, str]:
+        """Заголовок Authorization с текущим токеном"""
+        return {'Authorization': f'Bearer {self.token}' if self.token else ''}
+
+    def basic_auth_header(self) -> Optional[Dict[str, str]]:
+        """Заголовок Basic Auth для получения нового токена"""
+        if not self._login or not self._password:
+            print("⚠️ Данные для Basic Auth МойСклад не настроены")
+            return None
+        credentials = f"{self._login}:{self._password}"
+        encoded_credentials = base64.b64encode(credentials.encode()).decode()
+        return {'Authorization': f'Basic {encoded_credentials}'}
+
+    async def refresh(self, stale_token: Optional[str] = None) -> bool:
+        """Обновление токена после 401
+
+        stale_token - токен, с которым был получен 401. Если токен с тех пор
+        уже обновил другой запрос, новый запрос токена не делается.
+        """
+        if stale_token is not None and stale_token != self.token:
+            return True
+
+        if self._refresh_task is None or self._refresh_task.done():
+            if time.time() - self._failed_at < self._retry_after_failure:
+                print("⏳ Обновление токена недавно не удалось, повторим позже")
+                return False
+            self._refresh_task = asyncio.create_task(self._fetch_token())
+        # shield: отмена одного ожидающего запроса не отменяет общее обновление
+        return await asyncio.shield(self._refresh_task)
+
+    async def _fetch_token(self) -> bool:
+        """Запрос нового токена у МойСклад"""
+        headers = self.basic_auth_header()
+        if not headers:
+            print("❌ Не удалось создать заголовки Basic Auth")
+            self._failed_at = time.time()
+            return False
+
+        print("🔄 Получаем новый токен от МойСклад...")
+        try:
+            session = await self._get_session()
+            async with session.post(self._token_url, headers=headers) as response:
+                if response.status // 100 != 2:
+                    error_text = await response.text()
+                    print(f"❌ Ошибка получения токена MoySklad: {response.status} {error_text}")
+                    self._failed_at = time.time()
+                    return False
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"💥 Ошибка при получении токена: {e}")
+            self._failed_at = time.time()
+            return False
+
+        new_token = data.get('access_token')
+        if not new_token:
+            print("❌ Токен не найден в ответе")
+            self._failed_at = time.time()
+            return False
+
+        self.token = new_token
+        self.refreshed_at = time.time()
+        self._failed_at = 0
+        print(f"✅ Получен новый токен: {new_token[:20]}...")
+        return True
@@ -1,16 +1,32 @@
 import os
 import json
-from fastapi import FastAPI, Request, HTTPException
+import hmac
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.responses import HTMLResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
-import aiohttp
 from database import Database
 from moysklad_api import MoySkladAPI
-from config import SHOP_NAME, CURRENCY
-
-app = FastAPI(title="Telegram Shop WebApp")
+from config import SHOP_NAME, CURRENCY, MOYSKLAD_WEBHOOK_SECRET
+from json_codec import FastJSONResponse
+from facets import parse_filter
+from sorted_views import SORTS, SORT_POPULARITY
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Открытие HTTP-сессии МойСклад и запуск фонового обновления каталога"""
+    # Сохраненный снимок позволяет отдавать каталог сразу, не дожидаясь МойСклад
+    moysklad.load_snapshot()
+    await moysklad.start()
+    await moysklad.start_scheduler()
+    yield
+    await moysklad.stop_scheduler()
+    await moysklad.close()
+
+app = FastAPI(title="Telegram Shop WebApp", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Настройка шаблонов и статических файлов
 templates = Jinja2Templates(directory="templates")
@@ -30,6 +46,32 @@ async def get_cached_image(cache_key: str):
 db = Database()
 moysklad = MoySkladAPI()
 
+# Наибольшая страница выдачи (каталог на клиенте грузится страницами по 1000)
+MAX_PAGE_LIMIT = 1000
+
+# Популярность для sort=popularity: запрос к БД не чаще раза в POPULARITY_TTL секунд
+POPULARITY_TTL = 300
+_popularity = (0.0, {})
+
+def get_popularity():
+    """Популярность товаров из корзин и заказов (кэшируется на POPULARITY_TTL)"""
+    global _popularity
+    loaded_at, popularity = _popularity
+    if time.time() - loaded_at > POPULARITY_TTL:
+        # Новый словарь - сигнал снимку пересобрать перестановку популярности
+        popularity = db.get_product_popularity()
+        _popularity = (time.time(), popularity)
+    return popularity
+
+def split_cart_product_id(cart_product_id: str):
+    """Разбор ID позиции корзины: original_id, original_id_size или original_id_color_size"""
+    parts = cart_product_id.split('_')
+    if len(parts) >= 3:
+        return parts[0], parts[1] or None, parts[2] or None
+    if len(parts) == 2:
+        return parts[0], None, parts[1] or None
+    return parts[0], None, None
+
 @app.get("/")
 async def catalog_page():
     """Главная страница каталога"""
@@ -94,45 +136,41 @@ async def add_to_cart(request: Request):
         raise HTTPException(status_code=400, detail="Product ID required")
     
     # Получаем информацию о товаре
-    products = await moysklad.get_products(limit=1000, offset=0)
-    product = next((p for p in products if p.get('original_id') == product_id), None)
+    snapshot = await moysklad.get_snapshot()
+    product = snapshot.get(product_id)
     
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Проверяем остатки с учетом размера, если указан
-    max_stock = product.get('stock', 0)
-    if size and product.get('modifications_text'):
-        # Парсим строку вида "В наличии: 42-1, 44-0"
-        try:
-            mods = product['modifications_text'].replace('В наличии: ', '').split(', ')
-            size_to_stock = {m.split('-')[0]: int(float(m.split('-')[1])) for m in mods if '-' in m}
-            if size in size_to_stock:
-                max_stock = size_to_stock[size]
-        except Exception:
-            pass
-    if quantity > max_stock:
-        raise HTTPException(status_code=400, detail=f"Недостаточно товара. Доступно: {int(max_stock)}")
+    # Уникальный ID позиции для цвета и размера
+    cart_product_id = f"{product_id}_{color}_{size}" if color and size else f"{product_id}_{size}" if size else product_id
+    
+    # Проверяем остатки по матрице цвет x размер с учетом того, что уже лежит в корзине
+    max_stock = product.available(color, size)
+    cart_item = db.get_cart_item(user_id, cart_product_id)
+    in_cart = cart_item['quantity'] if cart_item else 0
+    if quantity + in_cart > max_stock:
+        raise HTTPException(status_code=400, detail=f"Недостаточно товара. Доступно: {max(max_stock - in_cart, 0)}")
     
     # Формируем название товара с цветом и размером
-    product_name = product['name']
+    product_name = product.name
     if color and size:
-        product_name = f"{product['name']} (цвет {color}, размер {size})"
+        product_name = f"{product.name} (цвет {color}, размер {size})"
     elif color:
-        product_name = f"{product['name']} (цвет {color})"
+        product_name = f"{product.name} (цвет {color})"
     elif size:
-        product_name = f"{product['name']} (размер {size})"
+        product_name = f"{product.name} (размер {size})"
     
     # Добавляем в корзину
     db.add_to_cart(
         user_id=user_id,
-        product_id=f"{product_id}_{color}_{size}" if color and size else f"{product_id}_{size}" if size else product_id,  # Уникальный ID для цвета и размера
+        product_id=cart_product_id,
         product_name=product_name,
         quantity=quantity,
-        price=product['price'],
+        price=product.price,
         size=size,
         color=color,
-        image=product.get('image')  # Добавляем изображение
+        image=product.image  # Добавляем изображение
     )
     
     return {"success": True, "message": "Товар добавлен в корзину"}
@@ -148,55 +186,89 @@ async def get_categories():
         return {"categories": []}
 
 @app.get("/api/products")
-async def get_products(limit: int = 50, offset: int = 0, category: str = None):
-    """API для получения списка товаров с пагинацией и фильтрацией по категории"""
-    # Загружаем больше товаров, чтобы учесть фильтрацию
-    load_limit = limit * 3 if category and category != 'all' else limit
-    products = await moysklad.get_products(limit=load_limit, offset=offset)
-    
-    # Фильтруем по категории если указана
-    if category and category != 'all':
-        original_count = len(products)
-        products = [p for p in products if p.get('category') == category]
-        print(f"Фильтрация по категории '{category}': из {original_count} найдено {len(products)} товаров")
+async def get_products(limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT), offset: int = Query(0, ge=0),
+                       category: str = None, cursor: str = None,
+                       filters: str = Query(None, alias="filter"), sort: str = None):
+    """API для получения списка товаров с пагинацией и фильтрацией по категории
+
+    Для бесконечной прокрутки передавайте next_cursor из предыдущего ответа:
+    курсор продолжает выдачу без повторов и пропусков и после обновления каталога.
     
-    # Ограничиваем результат до запрошенного лимита (только если не запрашиваем все товары)
-    if limit < 1000 and len(products) > limit:
-        products = products[:limit]
+    filter=color=white,black;size=42;price=1000-3000;in_stock=1 - фильтр по
+    фасетам; в ответ добавляются total и счетчики фасетов (facets).
     
-    # Проверяем, есть ли еще товары
-    has_more = len(products) == limit
+    sort=price_asc|price_desc|newest|in_stock_first|popularity - порядок
+    выдачи; сортированные страницы листаются по offset, в ответе есть total.
+    """
+    if category == 'all':
+        category = None
+    if sort is not None and sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"Неизвестная сортировка: {sort}")
+    popularity = get_popularity() if sort == SORT_POPULARITY else None
+    if filters is not None:
+        return await get_filtered_products(filters, category, limit, offset, sort, popularity)
+    if sort is not None:
+        products, total = await moysklad.get_sorted_page(sort, category, limit, offset, popularity)
+        print(f"API /api/products: sort={sort}, category={category}, offset={offset}, всего={total}")
+        return FastJSONResponse({
+            "products": products,
+            "has_more": offset + len(products) < total,
+            "next_cursor": None,
+            "total": total
+        })
+    try:
+        products, next_cursor = await moysklad.get_category_page(category, limit, offset, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    has_more = next_cursor is not None
     
-    # Если получили 0 товаров, значит больше нет
-    if len(products) == 0:
-        has_more = False
+    print(f"API /api/products: limit={limit}, offset={offset}, category={category}, получено={len(products)}, has_more={has_more}")
     
-    # Если получили товары, но меньше чем limit, проверяем есть ли еще
-    if len(products) > 0 and len(products) < limit:
-        # Проверяем, есть ли еще товары, делая дополнительный запрос
-        try:
-            next_offset = offset + load_limit
-            next_products = await moysklad.get_products(limit=10, offset=next_offset)
-            
-            # Если фильтруем по категории, проверяем есть ли товары этой категории в следующей порции
-            if category and category != 'all':
-                next_products = [p for p in next_products if p.get('category') == category]
-            
-            has_more = len(next_products) > 0
-            print(f"🔍 Дополнительная проверка: offset={next_offset}, получено={len(next_products)}, has_more={has_more}")
-        except Exception as e:
-            print(f"⚠️ Ошибка при дополнительной проверке: {e}")
-            has_more = False
+    # Готовый ответ: FastAPI не прогоняет каталог через jsonable_encoder
+    return FastJSONResponse({"products": products, "has_more": has_more, "next_cursor": next_cursor})
+
+async def get_filtered_products(filters: str, category: str, limit: int, offset: int,
+                                sort: str = None, popularity: dict = None):
+    """Товары под фильтром фасетов вместе со счетчиками фасетов"""
+    try:
+        parsed = parse_filter(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    print(f"API /api/products: limit={limit}, offset={offset}, получено={len(products)}, has_more={has_more}")
+    # Категория из адреса сужает выдачу (И), а не добавляется к категориям фильтра (ИЛИ)
+    products, total, facets = await moysklad.filter_products(parsed, limit, offset, sort, popularity, category)
+    print(f"API /api/products: filter={filters!r}, category={category}, найдено={total}, offset={offset}")
+    return FastJSONResponse({
+        "products": products,
+        "has_more": offset + len(products) < total,
+        "next_cursor": None,
+        "total": total,
+        "facets": facets
+    })
+
+@app.get("/api/search")
+async def search_products(q: str = "", limit: int = Query(20, ge=1, le=MAX_PAGE_LIMIT), offset: int = Query(0, ge=0)):
+    """Поиск товаров по названию, артикулу, категории, цвету и размеру"""
+    query = q.strip()
+    if not query:
+        return FastJSONResponse({"products": [], "total": 0, "has_more": False})
     
-    return {"products": products, "has_more": has_more}
+    products, total = await moysklad.search_products(query, limit, offset)
+    print(f"API /api/search: q={query!r}, найдено={total}, offset={offset}")
+    return FastJSONResponse({"products": products, "total": total, "has_more": offset + len(products) < total})
+
+@app.get("/api/suggest")
+async def suggest(q: str = "", limit: int = 5):
+    """Подсказки для строки поиска: товары, категории, цвета и размеры по префиксу"""
+    # Размер ответа ограничен независимо от запроса
+    suggestions = await moysklad.suggest(q, min(max(limit, 1), 20))
+    return FastJSONResponse({"query": q, **suggestions})
 
 @app.get("/api/products-with-images")
 async def get_products_with_images():
     """API для получения товаров с изображениями"""
     products = await moysklad.get_products(limit=1000, offset=0)
-    return {"products": products}
+    return FastJSONResponse({"products": products})
 
 @app.get("/api/categories")
 async def get_categories():
@@ -212,17 +284,8 @@ async def get_categories():
 async def get_categories_with_products():
     """API для получения списка категорий, в которых есть товары"""
     try:
-        # Получаем все товары для создания категорий
-        products = await moysklad.get_products(limit=1000, offset=0)
-        
-        # Подсчитываем количество товаров в каждой категории по folder.name
-        category_counts = {}
-        for product in products:
-            # Проверяем, что у товара есть остатки
-            if product.get('stock', 0) > 0:
-                # Используем category как категорию
-                category_name = product.get('category', 'Relealized')
-                category_counts[category_name] = category_counts.get(category_name, 0) + 1
+        # Количество товаров в наличии по категориям уже посчитано в фасетах снимка
+        category_counts = await moysklad.get_category_counts()
         
         # Создаем список категорий с количеством товаров
         categories_with_products = []
@@ -263,32 +326,17 @@ async def get_cart(user_id: str):
     cart_items = db.get_cart(user_id)
     # Дополнительно отдаем max_stock для каждой позиции (для фронта)
     try:
-        products = await moysklad.get_products(limit=1000, offset=0)
-        by_id = {p.get('original_id'): p for p in products}
+        snapshot = await moysklad.get_snapshot()
         for item in cart_items:
-            base_id = item['product_id']
-            size = None
-            if '_' in base_id:
-                parts = base_id.split('_')
-                base_id = parts[0]
-                size = parts[1] if len(parts) > 1 else None
-            p = by_id.get(base_id)
-            max_stock = p.get('stock', 0) if p else 0
-            if size and p and p.get('modifications_text'):
-                try:
-                    mods = p['modifications_text'].replace('В наличии: ', '').split(', ')
-                    size_to_stock = {m.split('-')[0]: int(float(m.split('-')[1])) for m in mods if '-' in m}
-                    if size in size_to_stock:
-                        max_stock = size_to_stock[size]
-                except Exception:
-                    pass
-            item['max_stock'] = int(max_stock)
+            base_id, color, size = split_cart_product_id(item['product_id'])
+            product = snapshot.get(base_id)
+            item['max_stock'] = product.available(color, size) if product else 0
     except Exception:
         # В случае ошибки просто не добавляем max_stock
         pass
 
     total = sum(item['price'] * item['quantity'] for item in cart_items)
-    return {"cart_items": cart_items, "total": total}
+    return FastJSONResponse({"cart_items": cart_items, "total": total})
 
 @app.post("/api/clear-cart")
 async def clear_cart(request: Request):
@@ -315,30 +363,17 @@ async def update_cart(request: Request):
     if not product_id:
         raise HTTPException(status_code=400, detail="Product ID required")
 
-    # Вытаскиваем оригинальный id и размер из составного product_id
-    base_id = product_id
-    size = None
-    if '_' in product_id:
-        parts = product_id.split('_')
-        base_id = parts[0]
-        size = parts[1] if len(parts) > 1 else None
+    # Вытаскиваем оригинальный id, цвет и размер из составного product_id
+    base_id, color, size = split_cart_product_id(product_id)
 
     # Получаем товар из источника, чтобы узнать актуальный остаток
-    products = await moysklad.get_products(limit=1000, offset=0)
-    product = next((p for p in products if p.get('original_id') == base_id), None)
+    snapshot = await moysklad.get_snapshot()
+    product = snapshot.get(base_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Определяем максимум по остатку
-    max_stock = product.get('stock', 0)
-    if size and product.get('modifications_text'):
-        try:
-            mods = product['modifications_text'].replace('В наличии: ', '').split(', ')
-            size_to_stock = {m.split('-')[0]: int(float(m.split('-')[1])) for m in mods if '-' in m}
-            if size in size_to_stock:
-                max_stock = size_to_stock[size]
-        except Exception:
-            pass
+    # Определяем максимум по остатку модификации
+    max_stock = product.available(color, size)
 
     # Клэмпим количество и применяем
     if new_quantity < 1:
@@ -395,34 +430,15 @@ async def update_cart_quantity(data: dict):
             db.remove_from_cart(user_id, product_id)
             return {"success": True, "message": "Товар удален из корзины"}
         
-        # Проверяем, не превышает ли количество доступные остатки
-        try:
-            # Получаем информацию о товаре для проверки остатков
-            products = await moysklad.get_products(limit=1000, offset=0)
-            base_product_id = product_id.split('_')[0] if '_' in product_id else product_id
-            
-            product = next((p for p in products if p.get('original_id') == base_product_id), None)
-            if product and '_' in product_id:
-                parts = product_id.split('_')
-                if len(parts) >= 3:  # original_id_color_size
-                    variant_color = parts[1]
-                    variant_size = parts[2]
-                    
-                    # Ищем конкретный вариант
-                    variant_stock = 0
-                    for variant in product.get('variants', []):
-                        if (variant_color in variant.get('colors', []) and 
-                            variant_size in variant.get('sizes', [])):
-                            variant_stock = variant.get('stock', 0)
-                            break
-                    
-                    if quantity > variant_stock:
-                        raise HTTPException(status_code=400, detail=f"Недостаточно товара. Доступно: {variant_stock}")
-                    
-                    print(f"✅ Проверка остатков: variant stock {variant_stock}, requested {quantity}")
-        except Exception as e:
-            print(f"⚠️ Предупреждение при проверке остатков: {e}")
-            # Продолжаем выполнение, если не удалось проверить остатки
+        # Проверяем, не превышает ли количество доступные остатки модификации
+        snapshot = await moysklad.get_snapshot()
+        base_product_id, variant_color, variant_size = split_cart_product_id(product_id)
+        product = snapshot.get(base_product_id)
+        if product:
+            variant_stock = product.available(variant_color, variant_size)
+            if quantity > variant_stock:
+                raise HTTPException(status_code=400, detail=f"Недостаточно товара. Доступно: {variant_stock}")
+            print(f"✅ Проверка остатков: variant stock {variant_stock}, requested {quantity}")
         
         # Обновляем количество в корзине
         print(f"🔄 Обновляем количество в корзине на {quantity}")
@@ -430,6 +446,8 @@ async def update_cart_quantity(data: dict):
         
         return {"success": True, "message": "Количество обновлено", "quantity": quantity}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Ошибка обновления количества в корзине: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -439,53 +457,72 @@ async def refresh_products():
     """API для принудительного обновления кэша товаров"""
     try:
         moysklad.force_refresh_products()
-        return {"success": True, "message": "Кэш товаров помечен для обновления", "status": "success"}
+        return {
+            "success": True,
+            "message": "Кэш товаров помечен для обновления",
+            "status": "success",
+            "refresh": moysklad.get_refresh_status()
+        }
     except Exception as e:
         print(f"❌ Ошибка обновления кэша товаров: {e}")
         return {"success": False, "message": f"Ошибка обновления кэша товаров: {e}"}
 
+@app.get("/api/refresh-status")
+async def refresh_status():
+    """Состояние фонового обновления каталога"""
+    return moysklad.get_refresh_status()
+
+@app.post("/api/moysklad/webhook")
+async def moysklad_webhook(request: Request, secret: str = ""):
+    """Вебхук МойСклад: точечное обновление измененных товаров, модификаций и остатков
+
+    МойСклад ждет ответа не дольше 1,5 секунды, поэтому события только
+    ставятся в очередь, а загрузка идет в фоне.
+    """
+    # Без секрета вебхук принимал бы события от кого угодно и тратил лимит API МойСклад
+    if not MOYSKLAD_WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Вебхук отключен: не задан MOYSKLAD_WEBHOOK_SECRET")
+    if not hmac.compare_digest(secret, MOYSKLAD_WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Неверный секрет вебхука")
+    
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Тело вебхука должно быть JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Тело вебхука должно быть JSON-объектом")
+    
+    accepted = moysklad.handle_webhook(payload)
+    return {"success": True, "accepted": accepted}
+
 @app.get("/api/product/{product_id}")
 async def get_product(product_id: str):
     """Получение товара по ID"""
     try:
         print(f"🔍 Получение товара: product_id={product_id}")
         
-        # Получаем все товары и ищем нужный по оригинальному ID
-        products = await moysklad.get_products(limit=1000, offset=0)
+        snapshot = await moysklad.get_snapshot()
         
         # Ищем товар по оригинальному ID
-        # product_id может быть в формате "original_id" или "original_id_size"
-        base_product_id = product_id.split('_')[0] if '_' in product_id else product_id
+        # product_id может быть в формате "original_id", "original_id_size" или "original_id_color_size"
+        base_product_id, variant_color, variant_size = split_cart_product_id(product_id)
         print(f"🔍 Ищем товар с base_product_id={base_product_id}")
         
-        product = None
-        for p in products:
-            if p.get('original_id') == base_product_id:
-                product = p
-                break
+        catalog_product = snapshot.get(base_product_id)
+        product = catalog_product.to_dict() if catalog_product else None
         
         if product:
+            # Изображение этого товара загружаем вне общей фоновой очереди
+            await moysklad.ensure_product_image(product)
+            
             # Если product_id содержит информацию о варианте (цвет/размер), 
-            # вычисляем правильный остаток для этого варианта
-            if '_' in product_id:
-                parts = product_id.split('_')
-                if len(parts) >= 3:  # original_id_color_size
-                    variant_color = parts[1]
-                    variant_size = parts[2]
-                    
-                    # Ищем конкретный вариант
-                    variant_stock = 0
-                    for variant in product.get('variants', []):
-                        if (variant_color in variant.get('colors', []) and 
-                            variant_size in variant.get('sizes', [])):
-                            variant_stock = variant.get('stock', 0)
-                            break
-                    
-                    # Создаем копию продукта с правильным остатком для варианта
-                    product_copy = product.copy()
-                    product_copy['stock'] = variant_stock
-                    print(f"✅ Товар найден: {product_copy.get('name', 'Unknown')}, variant stock: {variant_stock} (color: {variant_color}, size: {variant_size})")
-                    return {"product": product_copy}
+            # отдаем остаток этого варианта из матрицы остатков
+            if variant_color or variant_size:
+                variant_id, variant_stock = catalog_product.stock_cell(variant_color, variant_size) or (None, 0)
+                product['stock'] = variant_stock
+                product['variant_id'] = variant_id
+                print(f"✅ Товар найден: {product.get('name', 'Unknown')}, variant stock: {variant_stock} (color: {variant_color}, size: {variant_size})")
+                return {"product": product}
             
             print(f"✅ Товар найден: {product.get('name', 'Unknown')}, stock: {product.get('stock', 0)}")
             return {"product": product}
@@ -500,19 +537,15 @@ async def get_product(product_id: str):
 async def product_page(product_id: str):
     """Страница товара"""
     try:
-        # Получаем больше товаров для поиска
-        products = await moysklad.get_products(limit=1000, offset=0)
-        
         # Ищем товар
-        product = None
-        for p in products:
-            if p.get('original_id') == product_id:
-                product = p
-                break
+        product = await moysklad.get_product_by_id(product_id)
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
+        # Изображение этого товара загружаем вне общей фоновой очереди
+        await moysklad.ensure_product_image(product)
+        
         return templates.TemplateResponse("product.html", {
             "request": {}, 
             "product": product
@@ -538,32 +571,28 @@ async def clear_cache():
 async def proxy_image(image_id: str):
     """Прокси для изображений MoySklad с авторизацией"""
     try:
-        # Получаем заголовки авторизации из MoySklad
-        headers = moysklad.headers
-        
         # Формируем URL изображения
         image_url = f"https://api.moysklad.ru/api/remap/1.2/download/{image_id}"
         
-        # Загружаем изображение с авторизацией
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url, headers=headers) as response:
-                if response.status == 200:
-                    # Получаем содержимое изображения
-                    image_data = await response.read()
-                    content_type = response.headers.get('content-type', 'image/jpeg')
-                    
-                    # Возвращаем изображение
-                    return Response(
-                        content=image_data,
-                        media_type=content_type,
-                        headers={
-                            'Cache-Control': 'public, max-age=3600',
-                            'Access-Control-Allow-Origin': '*'
-                        }
-                    )
-                else:
-                    raise HTTPException(status_code=response.status, detail="Image not found")
-                    
+        # Загружаем изображение с авторизацией через общий пул и ограничитель запросов
+        async with moysklad.request(image_url) as response:
+            if response.status == 200:
+                # Получаем содержимое изображения
+                image_data = await response.read()
+                content_type = response.headers.get('content-type', 'image/jpeg')
+                
+                # Возвращаем изображение
+                return Response(
+                    content=image_data,
+                    media_type=content_type,
+                    headers={
+                        'Cache-Control': 'public, max-age=3600',
+                        'Access-Control-Allow-Origin': '*'
+                    }
+                )
+            else:
+                raise HTTPException(status_code=response.status, detail="Image not found")
+                
     except Exception as e:
         print(f"❌ Ошибка прокси изображения: {e}")
         raise HTTPException(status_code=500, detail=f"Error loading image: {e}")